@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""Benchmark local callsign matching against full-feed packet rates.
+
+Generates a synthetic feed where only a small fraction of packets come from
+monitored stations, and times the raw-line matching done before decoding, next
+to the cost of decoding every line with aprs3. Run from the repository root:
+
+    python -m benchmarks.bench_match
+"""
+
+import random
+import string
+import time
+
+import aprs
+import asyncclick as click
+
+from check_aprs import CallsignIndex
+
+
+def random_callsign(rng: random.Random) -> str:
+    prefix = "".join(rng.choices(string.ascii_uppercase, k=rng.randint(1, 2)))
+    suffix = "".join(rng.choices(string.ascii_uppercase, k=rng.randint(1, 3)))
+    callsign = f"{prefix}{rng.randint(0, 9)}{suffix}"
+    if rng.random() < 0.5:
+        callsign += f"-{rng.randint(1, 15)}"
+    return callsign
+
+
+@click.command()
+@click.option("--monitored", default=5000, show_default=True)
+@click.option("--packets", default=1_000_000, show_default=True)
+@click.option("--match-rate", default=0.01, show_default=True)
+@click.option("--seed", default=0, show_default=True)
+def main(monitored, packets, match_rate, seed):
+    rng = random.Random(seed)
+
+    hosts = {}
+    while len(hosts) < monitored:
+        callsign = random_callsign(rng).partition("-")[0]
+        # a tenth of the monitored stations are matched on any SSID
+        if rng.random() < 0.1:
+            callsign += "-*"
+        hosts[callsign] = f"host-{len(hosts)}"
+    index = CallsignIndex(hosts)
+
+    monitored_sources = [
+        c[:-2] + f"-{rng.randint(1, 15)}" if c.endswith("-*") else c for c in hosts
+    ]
+    lines = []
+    for _ in range(packets):
+        if rng.random() < match_rate:
+            source = rng.choice(monitored_sources)
+        else:
+            source = random_callsign(rng)
+        lines.append(
+            f"{source}>APRS,TCPIP*,qAC,T2TEST:!4903.50N/07201.75W-Test".encode()
+        )
+
+    start = time.perf_counter()
+    matched = 0
+    for line in lines:
+        if index.match(line[: line.find(b">")]) is not None:
+            matched += 1
+    elapsed = time.perf_counter() - start
+    click.echo(
+        f"match:  {packets / elapsed:12,.0f} packets/s "
+        f"({elapsed / packets * 1e9:.0f} ns/packet, {matched} matched)"
+    )
+
+    sample = lines[: min(packets, 20_000)]
+    start = time.perf_counter()
+    for line in sample:
+        aprs.APRSFrame.from_str(line.decode("latin-1"))
+    elapsed = time.perf_counter() - start
+    click.echo(
+        f"decode: {len(sample) / elapsed:12,.0f} packets/s "
+        f"({elapsed / len(sample) * 1e9:.0f} ns/packet)"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""Check the fast TNC2 parser against aprs3, and benchmark both.
+
+Reads a corpus of raw lines, either capture files written with --record or
+plain text files of TNC2 lines. Every line the fast parser accepts is also
+decoded with aprs3, and any difference in the fields check_aprs uses is
+reported. Then it times the fast parser, aprs3, and the fast parser with
+aprs3 as fallback, as check_aprs runs them. Run from the repository root:
+
+    python -m benchmarks.bench_parse captures/aprsis-*.gz
+
+Exits with status 1 if the parsers disagree on any line. The same check runs
+on the corpus in tests/data as part of the test suite.
+"""
+
+import itertools
+import math
+import pathlib
+import sys
+import time
+
+import aprs
+import asyncclick as click
+
+from check_aprs import Packet, parse_packet, read_captures
+
+
+def read_corpus(paths: list[pathlib.Path]) -> list[bytes]:
+    lines = []
+    for path in paths:
+        if path.suffix == ".gz":
+            lines += [line for _, line in read_captures([path])]
+        else:
+            lines += path.read_bytes().splitlines()
+    return [line for line in lines if line and not line.startswith(b"#")]
+
+
+def decode(line: bytes) -> Packet | None:
+    try:
+        return Packet.from_frame(aprs.APRSFrame.from_str(line.decode("latin-1")))
+    except Exception:
+        return None
+
+
+def differences(fast: Packet, slow: Packet) -> list[str]:
+    diffs = [
+        f"{field}: {getattr(fast, field)!r} != {getattr(slow, field)!r}"
+        for field in ("source", "data_type", "comment")
+        if getattr(fast, field) != getattr(slow, field)
+    ]
+    if (fast.position is None) != (slow.position is None) or (
+        fast.position is not None
+        and not all(
+            math.isclose(a, b, abs_tol=1e-4)
+            for a, b in zip(fast.position, slow.position, strict=True)
+        )
+    ):
+        diffs.append(f"position: {fast.position!r} != {slow.position!r}")
+    return diffs
+
+
+def time_per_line(parse, lines: list[bytes]) -> float:
+    start = time.perf_counter()
+    for line in lines:
+        parse(line)
+    return (time.perf_counter() - start) / len(lines)
+
+
+@click.command()
+@click.option("--show", default=10, show_default=True, help="Mismatches to print")
+@click.argument(
+    "corpus",
+    nargs=-1,
+    required=True,
+    type=click.Path(exists=True, dir_okay=False, path_type=pathlib.Path),
+)
+def main(show, corpus):
+    lines = read_corpus(corpus)
+    if not lines:
+        raise click.UsageError("corpus contains no packets")
+
+    fast_parsed = fast_only = 0
+    mismatches = []
+    for line in lines:
+        fast = parse_packet(line)
+        if fast is None:
+            continue
+        fast_parsed += 1
+        slow = decode(line)
+        if slow is None:
+            fast_only += 1
+        elif diffs := differences(fast, slow):
+            mismatches.append((line, diffs))
+
+    click.echo(
+        f"{len(lines):,} packets, {fast_parsed / len(lines):.1%} on the fast path, "
+        f"{fast_only} rejected only by aprs3, {len(mismatches)} mismatched"
+    )
+    for line, diffs in itertools.islice(mismatches, show):
+        click.echo(f"  {line!r}")
+        for diff in diffs:
+            click.echo(f"    {diff}")
+
+    fast_lines = [line for line in lines if parse_packet(line) is not None]
+    results = {
+        "fast parser": (parse_packet, fast_lines),
+        "aprs3 (same packets)": (decode, fast_lines),
+        "fast + fallback": (lambda line: parse_packet(line) or decode(line), lines),
+        "aprs3 (all packets)": (decode, lines),
+    }
+    for name, (parse, sample) in results.items():
+        if sample:
+            cost = time_per_line(parse, sample)
+            click.echo(f"{name:22} {cost * 1e9:10,.0f} ns/packet")
+
+    sys.exit(1 if mismatches else 0)
+
+
+if __name__ == "__main__":
+    main()
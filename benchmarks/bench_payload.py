@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""Benchmark encoding of process-check-result request bodies.
+
+Compares building a dict per check result and JSON-encoding it whole (as
+passing json= to aiohttp does) with PayloadBuilder's cached per-service
+prefixes, using the stdlib encoder and orjson if it is installed. Run from the
+repository root:
+
+    python -m benchmarks.bench_payload
+"""
+
+import json
+import random
+import time
+
+import asyncclick as click
+
+from check_aprs import CheckResult, PayloadBuilder, encode_string_stdlib
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def dict_payload(result: CheckResult) -> bytes:
+    data = {
+        "type": "Service",
+        "service": f"{result.host}!{result.service}",
+        "exit_status": result.exit_status,
+        "plugin_output": result.plugin_output,
+        "check_source": "APRSIS",
+    }
+    if result.performance_data is not None:
+        data["performance_data"] = result.performance_data
+    return json.dumps(data).encode()
+
+
+@click.command()
+@click.option("--stations", default=1000, show_default=True)
+@click.option("--results", default=200_000, show_default=True)
+@click.option(
+    "--rate",
+    default=10_000,
+    show_default=True,
+    help="Submissions per second to report the CPU share for",
+)
+@click.option("--seed", default=0, show_default=True)
+def main(stations, results, rate, seed):
+    rng = random.Random(seed)
+    checks = []
+    for _ in range(results):
+        i = rng.randrange(stations)
+        if rng.random() < 0.5:
+            message = "Position: 42.36, -71.06"
+            perfdata = None
+        else:
+            message = "Telemetry: 123,45,67,89,12,00000000"
+            perfdata = [f"A{n}={rng.randint(0, 255)}" for n in range(1, 6)]
+        checks.append(
+            CheckResult(
+                f"N{i}TEST", f"host-{i}", "aprsis", 0, f"OK: {message}", perfdata
+            )
+        )
+
+    encoders = {"dict": dict_payload}
+    encoders["template"] = PayloadBuilder(encode_string_stdlib).build
+    if orjson is not None:
+        encoders["template+orjson"] = PayloadBuilder(orjson.dumps).build
+
+    for name, encode in encoders.items():
+        for result in checks[:100]:
+            assert json.loads(encode(result)) == json.loads(dict_payload(result))
+
+        start = time.perf_counter()
+        for result in checks:
+            encode(result)
+        elapsed = time.perf_counter() - start
+        per_result = elapsed / results
+        click.echo(
+            f"{name:16} {results / elapsed:12,.0f} results/s "
+            f"({per_result * 1e9:.0f} ns/result, "
+            f"{per_result * rate:.1%} of a core at {rate:,}/s)"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""Benchmark resolving check results by host!service name against filters.
+
+check_aprs used to target each process-check-result call with a filter on
+the service name and host.vars.aprs.callsign, which Icinga evaluates against
+every service object; it now names "host!aprsis" directly. This times the
+target resolution done by the fake Icinga API for both kinds of request, as
+a model of the server-side cost per check result, and checks that both
+resolve to the same service. Run from the repository root:
+
+    python -m benchmarks.bench_targeting --stations 1000 --services-per-host 5
+"""
+
+import json
+import random
+import time
+
+import asyncclick as click
+
+from benchmarks.fake_icinga import FakeIcinga
+from check_aprs import CheckResult, PayloadBuilder
+
+
+def filter_payload(result: CheckResult) -> bytes:
+    "The request body check_aprs sent before targeting services by name"
+    data = {
+        "type": "Service",
+        "filter": f'service.name=="{result.service}" && '
+        f'host.vars.aprs.callsign=="{result.callsign}"',
+        "exit_status": result.exit_status,
+        "plugin_output": result.plugin_output,
+        "check_source": "APRSIS",
+    }
+    return json.dumps(data).encode()
+
+
+@click.command()
+@click.option("--stations", default=1000, show_default=True)
+@click.option(
+    "--services-per-host",
+    default=5,
+    show_default=True,
+    help="Services on each host besides aprsis",
+)
+@click.option("--results", default=2000, show_default=True)
+@click.option("--seed", default=0, show_default=True)
+def main(stations, services_per_host, results, seed):
+    rng = random.Random(seed)
+    callsigns = [f"N{i}TEST" for i in range(stations)]
+    icinga = FakeIcinga(callsigns, services_per_host=services_per_host)
+    checks = [
+        CheckResult(callsign, f"host-{callsign}", "aprsis", 0, "OK: Position", None)
+        for callsign in rng.choices(callsigns, k=results)
+    ]
+
+    encoders = {"filter": filter_payload, "host!service": PayloadBuilder().build}
+    payloads = {
+        name: [json.loads(encode(result)) for result in checks]
+        for name, encode in encoders.items()
+    }
+    for old, new in zip(*payloads.values()):
+        assert icinga.resolve(old) == icinga.resolve(new)
+
+    click.echo(f"{len(icinga.services):,} service objects")
+    baseline = None
+    for name, requests in payloads.items():
+        start = time.perf_counter()
+        for data in requests:
+            icinga.resolve(data)
+        per_result = (time.perf_counter() - start) / results
+        baseline = baseline or per_result
+        click.echo(
+            f"{name:14} {per_result * 1e6:10.2f} us/result "
+            f"({baseline / per_result:,.0f}x speedup)"
+        )
+
+
+if __name__ == "__main__":
+    main()
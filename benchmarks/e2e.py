@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""End-to-end throughput and latency benchmark.
+
+Runs APRSListener against a fake APRS-IS server and a fake Icinga2 API on
+localhost, and prints machine-readable results as JSON. Run from the
+repository root:
+
+    python -m benchmarks.e2e --rate 2000 --duration 30 --output results.json
+"""
+
+import asyncio
+import json
+import resource
+import statistics
+import sys
+import time
+
+import aiohttp
+import asyncclick as click
+
+from benchmarks.fake_aprsis import FakeAPRSIS
+from benchmarks.fake_icinga import FakeIcinga
+from check_aprs import APRSListener, Overflow
+
+
+def percentile(values: list[float], pct: float) -> float | None:
+    if len(values) < 2:
+        return values[0] if values else None
+    return statistics.quantiles(values, n=100, method="inclusive")[pct - 1]
+
+
+async def run_benchmark(
+    stations: int,
+    rate: float,
+    duration: float,
+    noise: float,
+    icinga_latency: float,
+    icinga_error_rate: float,
+    replay: list[str] | None,
+    full_feed: bool,
+    **listener_options,
+) -> dict:
+    callsigns = [f"N{i // 1000}BEN{i % 1000:03d}" for i in range(stations)]
+    icinga = FakeIcinga(callsigns, icinga_latency, icinga_error_rate)
+    aprsis = FakeAPRSIS(callsigns, rate, noise, replay=replay)
+    icinga_port = await icinga.start()
+    aprsis_port = await aprsis.start()
+
+    async with aiohttp.ClientSession(
+        base_url=f"http://127.0.0.1:{icinga_port}",
+        headers={"Accept": "application/json"},
+    ) as session:
+        listener = APRSListener(
+            aprsis_host="127.0.0.1",
+            session=session,
+            aprsis_port=aprsis_port,
+            feed_filter="" if full_feed else None,
+            **listener_options,
+        )
+        task = asyncio.create_task(listener.run())
+        start = time.monotonic()
+        await asyncio.sleep(duration)
+        elapsed = time.monotonic() - start
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+
+    await aprsis.stop()
+    await icinga.stop()
+
+    packets = listener.metrics.counters["packets"]
+    return {
+        "config": {
+            "stations": stations,
+            "rate": rate,
+            "duration": duration,
+            "noise": noise,
+            "full_feed": full_feed,
+            "icinga_latency": icinga_latency,
+            "icinga_error_rate": icinga_error_rate,
+            **listener_options,
+        },
+        "packets_sent": aprsis.sent,
+        "packets_handled": packets,
+        "packets_per_second": packets / elapsed,
+        "latency_p50": percentile(icinga.latencies, 50),
+        "latency_p99": percentile(icinga.latencies, 99),
+        "icinga_requests": icinga.requests,
+        "icinga_pings": icinga.pings,
+        "icinga_errors": icinga.errors,
+        "icinga_requests_per_packet": icinga.requests / packets if packets else None,
+        # includes the fake servers, which run in the same process
+        "max_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        "metrics": dict(listener.metrics.counters),
+    }
+
+
+@click.command()
+@click.option("--stations", default=100, show_default=True)
+@click.option("--rate", default=1000.0, show_default=True, help="Packets per second")
+@click.option("--duration", default=10.0, show_default=True, help="Seconds")
+@click.option(
+    "--noise",
+    default=0.0,
+    show_default=True,
+    help="Fraction of packets from unmonitored stations",
+)
+@click.option("--full-feed", is_flag=True, help="Match callsigns locally")
+@click.option(
+    "--replay",
+    type=click.File(),
+    help="Send TNC2 lines from this file instead of generated packets",
+)
+@click.option("--icinga-latency", default=0.0, show_default=True)
+@click.option("--icinga-error-rate", default=0.0, show_default=True)
+@click.option("--workers", default=4, show_default=True)
+@click.option("--queue-size", default=1000, show_default=True)
+@click.option(
+    "--overflow",
+    type=click.Choice([o.value for o in Overflow]),
+    default=Overflow.BLOCK.value,
+    show_default=True,
+)
+@click.option("--coalesce-window", default=5.0, show_default=True)
+@click.option("--output", type=click.File("w"), default=sys.stdout)
+async def main(
+    stations,
+    rate,
+    duration,
+    noise,
+    full_feed,
+    replay,
+    icinga_latency,
+    icinga_error_rate,
+    workers,
+    queue_size,
+    overflow,
+    coalesce_window,
+    output,
+):
+    results = await run_benchmark(
+        stations,
+        rate,
+        duration,
+        noise,
+        icinga_latency,
+        icinga_error_rate,
+        [line.rstrip("\r\n") for line in replay] if replay else None,
+        full_feed,
+        workers=workers,
+        queue_size=queue_size,
+        overflow=Overflow(overflow),
+        coalesce_window=coalesce_window,
+    )
+    json.dump(results, output, indent=2)
+    output.write("\n")
+
+
+if __name__ == "__main__":
+    main()
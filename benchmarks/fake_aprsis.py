@@ -0,0 +1,137 @@
+"""A local stand-in for an APRS-IS server.
+
+Accepts logins on any port, honours "b/" filters from the login line and
+"#filter" commands, and sends generated (or replayed) packets at a fixed rate.
+Generated packets carry their send time as "ts=<unix time>" in the comment, so
+the fake Icinga API can compute packet-to-ack latency.
+"""
+
+import asyncio
+import dataclasses
+import datetime
+import random
+import re
+import time
+
+
+@dataclasses.dataclass
+class Client:
+    writer: asyncio.StreamWriter
+    # None means unfiltered (e.g. a full feed)
+    callsigns: set[str] | None = None
+
+    def set_filter(self, command: str):
+        if match := re.search(r"filter (?:.* )?b/(\S+)", command):
+            self.callsigns = set(match.group(1).split("/"))
+        elif "filter" in command:
+            self.callsigns = None
+
+    def wants(self, source: str) -> bool:
+        if self.callsigns is None:
+            return True
+        return source in self.callsigns or any(
+            c.endswith("*") and source.startswith(c[:-1]) for c in self.callsigns
+        )
+
+
+@dataclasses.dataclass
+class FakeAPRSIS:
+    callsigns: list[str]
+    rate: float = 100
+    # fraction of generated packets from unmonitored stations
+    noise: float = 0
+    # seconds subtracted from keepalive timestamps, to simulate a lagging server
+    lag: float = 0
+    keepalive_interval: float = 20
+    replay: list[str] | None = None
+    name: str = "FAKE"
+    sent: int = 0
+    clients: list[Client] = dataclasses.field(default_factory=list)
+    # connection handler tasks, and the writer each one closes when it ends
+    handlers: dict[asyncio.Task, asyncio.StreamWriter] = dataclasses.field(
+        default_factory=dict
+    )
+
+    async def start(self, host="127.0.0.1", port=0) -> int:
+        self.server = await asyncio.start_server(self.handle_client, host, port)
+        self.generator = asyncio.create_task(self.generate())
+        return self.server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        self.server.close()
+        self.generator.cancel()
+        # closing the connection ends the handler's reads, so it returns rather
+        # than being cancelled
+        for writer in self.handlers.values():
+            writer.close()
+        await asyncio.gather(self.generator, *self.handlers, return_exceptions=True)
+        await self.server.wait_closed()
+
+    async def handle_client(self, reader, writer):
+        handler = asyncio.current_task()
+        self.handlers[handler] = writer
+        writer.write(f"# {self.name} fake aprsis\r\n".encode())
+        client = Client(writer)
+        try:
+            login = (await reader.readline()).decode()
+            client.set_filter(login)
+            user = login.split()[1] if login.startswith("user ") else "N0CALL"
+            logresp = f"# logresp {user} unverified, server {self.name}\r\n"
+            writer.write(logresp.encode())
+            self.clients.append(client)
+            async for line in reader:
+                if line.startswith(b"#"):
+                    client.set_filter(line.decode())
+        finally:
+            if client in self.clients:
+                self.clients.remove(client)
+            del self.handlers[handler]
+            writer.close()
+
+    def packet(self, rng: random.Random) -> str:
+        if self.replay is not None:
+            return self.replay[self.sent % len(self.replay)]
+        if rng.random() < self.noise:
+            source = f"N{rng.randint(0, 9)}NOISE-{rng.randint(1, 15)}"
+        else:
+            source = rng.choice(self.callsigns)
+            if source.endswith("-*"):
+                source = f"{source[:-2]}-{rng.randint(1, 15)}"
+        return (
+            f"{source}>APRS,TCPIP*,qAC,{self.name}:"
+            f"!4903.50N/07201.75W-ts={time.time():.6f}"
+        )
+
+    def send(self, line: str):
+        source = line.partition(">")[0]
+        data = f"{line}\r\n".encode()
+        for client in self.clients:
+            if client.wants(source):
+                client.writer.write(data)
+        self.sent += 1
+
+    def keepalive(self):
+        now = datetime.datetime.now(datetime.UTC) - datetime.timedelta(seconds=self.lag)
+        data = (
+            f"# aprsc 2.1.0-fake {now:%d %b %Y %H:%M:%S} GMT {self.name} "
+            "127.0.0.1:14580\r\n"
+        ).encode()
+        for client in self.clients:
+            client.writer.write(data)
+
+    async def generate(self):
+        rng = random.Random(0)
+        start = last_keepalive = time.monotonic()
+        sent = 0
+        while True:
+            await asyncio.sleep(0.01)
+            now = time.monotonic()
+            due = int((now - start) * self.rate)
+            for _ in range(due - sent):
+                self.send(self.packet(rng))
+            sent = due
+            if now - last_keepalive >= self.keepalive_interval:
+                self.keepalive()
+                last_keepalive = now
+            for client in self.clients:
+                await client.writer.drain()
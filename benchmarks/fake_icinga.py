@@ -0,0 +1,149 @@
+"""A local stand-in for the Icinga2 API.
+
+Serves the host query used to build the callsign index, records every
+process-check-result call, and can inject latency and errors. Like Icinga,
+process-check-result resolves its target either by looking up the
+"host!service" name directly, or by evaluating a filter against every
+service object, and answers 404 when nothing matches.
+"""
+
+import asyncio
+import dataclasses
+import random
+import re
+import time
+
+from aiohttp import web
+
+TIMESTAMP = re.compile(r"ts=(\d+\.\d+)")
+# the attr=="value" comparisons of a filter, joined by &&
+COMPARISON = re.compile(r'([\w.]+)\s*==\s*"([^"]*)"')
+
+
+def attribute(obj: dict, path: str):
+    for key in path.split("."):
+        if not isinstance(obj, dict) or key not in obj:
+            return None
+        obj = obj[key]
+    return obj
+
+
+@dataclasses.dataclass
+class FakeIcinga:
+    callsigns: list[str]
+    # seconds added to every process-check-result call
+    latency: float = 0
+    # fraction of process-check-result calls answered with a 503
+    error_rate: float = 0
+    # answer /v1/events with a 404, forcing the polling fallback
+    events: bool = True
+    requests: int = 0
+    pings: int = 0
+    errors: int = 0
+    latencies: list[float] = dataclasses.field(default_factory=list)
+    results: list[dict] = dataclasses.field(default_factory=list)
+    record_results: bool = False
+    # other services on each host, which a filter has to be evaluated against
+    services_per_host: int = 0
+    # time spent resolving process-check-result targets
+    resolve_seconds: float = 0
+
+    def __post_init__(self):
+        # "host!service" -> the service, and its host, as filters see them
+        self.services = {
+            "localhost!check_aprs": {
+                "service": {"name": "check_aprs"},
+                "host": {"name": "localhost", "vars": {}},
+            }
+        }
+        for callsign in self.callsigns:
+            host = {
+                "name": f"host-{callsign}",
+                "vars": {"aprs": {"callsign": callsign}},
+            }
+            names = ["aprsis"] + [f"other-{i}" for i in range(self.services_per_host)]
+            for name in names:
+                self.services[f"{host['name']}!{name}"] = {
+                    "service": {"name": name},
+                    "host": host,
+                }
+
+    def resolve(self, data: dict) -> list[str]:
+        "The names of the services a process-check-result call applies to"
+        start = time.perf_counter()
+        if "service" in data:
+            targets = [data["service"]] if data["service"] in self.services else []
+        else:
+            comparisons = COMPARISON.findall(data.get("filter", ""))
+            targets = [
+                name
+                for name, service in self.services.items()
+                if all(attribute(service, path) == value for path, value in comparisons)
+            ]
+        self.resolve_seconds += time.perf_counter() - start
+        return targets
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_get("/v1/objects/hosts", self.hosts)
+        app.router.add_post("/v1/actions/process-check-result", self.check_result)
+        app.router.add_post("/v1/events", self.event_stream)
+        return app
+
+    async def start(self, host="127.0.0.1", port=0) -> int:
+        # cancel the never-ending event stream when check_aprs disconnects,
+        # rather than waiting out the shutdown timeout in stop()
+        self.runner = web.AppRunner(self.app(), handler_cancellation=True)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, host, port)
+        await site.start()
+        return site._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        await self.runner.cleanup()
+
+    async def hosts(self, request: web.Request) -> web.Response:
+        return web.json_response(
+            {
+                "results": [
+                    {
+                        "name": f"host-{callsign}",
+                        "type": "Host",
+                        "attrs": {"vars": {"aprs": {"callsign": callsign}}},
+                    }
+                    for callsign in self.callsigns
+                ]
+            }
+        )
+
+    async def check_result(self, request: web.Request) -> web.Response:
+        data = await request.json()
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if random.random() < self.error_rate:
+            self.errors += 1
+            return web.json_response({"error": 503}, status=503)
+        if not self.resolve(data):
+            return web.json_response(
+                {"error": 404, "status": "No objects found."}, status=404
+            )
+
+        if "filter" in data:  # the check_aprs heartbeat
+            self.pings += 1
+        else:
+            self.requests += 1
+            if match := TIMESTAMP.search(data.get("plugin_output", "")):
+                # measured when the response is sent, so it includes the
+                # injected latency as check_aprs sees it
+                self.latencies.append(time.time() - float(match.group(1)))
+        if self.record_results:
+            self.results.append(data)
+        return web.json_response({"results": [{"code": 200.0}]})
+
+    async def event_stream(self, request: web.Request) -> web.StreamResponse:
+        if not self.events:
+            raise web.HTTPNotFound()
+        response = web.StreamResponse()
+        await response.prepare(request)
+        while True:
+            await asyncio.sleep(3600)
@@ -1,85 +1,2350 @@
 #!/usr/bin/env python3
 
 import asyncio
+import bisect
+import collections
+import contextlib
+import contextvars
+import copy
 import dataclasses
 import datetime
+import enum
+import functools
+import gzip
+import json
+import logging
+import logging.handlers
+import math
+import pathlib
+import queue
+import random
+import re
+import signal
+import socket
+import sys
+import threading
+import time
+import zlib
+from typing import Awaitable, Callable, Iterable
 
 import aiohttp
 import aprs
 import asyncclick as click
+from aiohttp import web
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+SOFTWARE_VERSION = "check_aprs 0.1.0"
+
+log = logging.getLogger("check_aprs")
+# per-packet debug output, sampled separately
+packet_log = logging.getLogger("check_aprs.packets")
+
+
+class JSONFormatter(logging.Formatter):
+    "Formats log records as one JSON object per line"
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            **getattr(record, "fields", {}),
+        }
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry)
+
+
+class LogQueueHandler(logging.handlers.QueueHandler):
+    """Queues records with their message and traceback rendered, but apart.
+
+    QueueHandler.prepare folds the traceback into the message, which would
+    leave JSONFormatter no exception to put in its own field.
+    """
+
+    exception_formatter = logging.Formatter()
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.msg, record.args = record.getMessage(), None
+        if record.exc_info:
+            record.exc_text = self.exception_formatter.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+class SampleFilter(logging.Filter):
+    "Passes one in every `rate` records"
+
+    def __init__(self, rate: int):
+        super().__init__()
+        self.rate = rate
+        self.count = 0
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        self.count += 1
+        return self.count % self.rate == 0
+
+
+def setup_logging(
+    level: str, json_format: bool, packet_sample: int
+) -> logging.handlers.QueueListener:
+    """Route logging through a queue drained by a background thread.
+
+    This keeps slow log output (e.g. a Docker log driver) from blocking the
+    event loop.
+    """
+    handler = logging.StreamHandler()
+    if json_format:
+        handler.setFormatter(JSONFormatter())
+    else:
+        handler.setFormatter(logging.Formatter("%(levelname)s %(name)s: %(message)s"))
+
+    log_queue: queue.SimpleQueue[logging.LogRecord] = queue.SimpleQueue()
+    log.addHandler(LogQueueHandler(log_queue))
+    log.setLevel(level.upper())
+    packet_log.addFilter(SampleFilter(packet_sample))
+
+    listener = logging.handlers.QueueListener(log_queue, handler)
+    listener.start()
+    return listener
+
+
+class Histogram:
+    "A Prometheus-style histogram with fixed bucket upper bounds"
+
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    DEFAULT_BUCKETS = (0.001, 0.01, 0.05, 0.1, 0.5, 1, 5, 10)
+
+    def __init__(self, buckets: tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> float | None:
+        "Upper bound of the bucket containing the q-quantile, None if unbounded"
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            if cumulative >= q * self.count:
+                return bound
+        return None
+
+
+@dataclasses.dataclass
+class Metrics:
+    """Internal counters, gauges and histograms.
+
+    Series are keyed by their name, with Prometheus-style labels appended
+    (e.g. 'packets_received{type="POSITION"}'), so updating one is a single
+    dict operation. They are served in text exposition format, and reported
+    as perfdata on the check_aprs service.
+    """
+
+    counters: collections.Counter = dataclasses.field(
+        default_factory=collections.Counter
+    )
+    gauges: dict[str, Callable[[], float]] = dataclasses.field(default_factory=dict)
+    histograms: dict[str, Histogram] = dataclasses.field(default_factory=dict)
+
+    def inc(self, series: str, value: int = 1):
+        self.counters[series] += value
+
+    def observe(
+        self,
+        series: str,
+        value: float,
+        buckets: tuple[float, ...] = Histogram.DEFAULT_BUCKETS,
+    ):
+        histogram = self.histograms.get(series)
+        if histogram is None:
+            histogram = self.histograms[series] = Histogram(buckets)
+        histogram.observe(value)
+
+    @staticmethod
+    def perfdata_label(series: str) -> str:
+        name, _, labels = series.partition("{")
+        return "_".join([name, *re.findall(r'"([^"]*)"', labels)])
+
+    def perfdata(self) -> list[str]:
+        return [
+            *(f"{self.perfdata_label(k)}={v}c" for k, v in self.counters.items()),
+            *(f"{self.perfdata_label(k)}={g()}" for k, g in self.gauges.items()),
+            *(
+                f"{self.perfdata_label(k)}_avg={h.sum / h.count:.6f}s"
+                for k, h in self.histograms.items()
+                if h.count
+            ),
+        ]
+
+    def exposition(self) -> str:
+        lines = []
+        declared = set()
+
+        def declare(name: str, kind: str):
+            if name not in declared:
+                declared.add(name)
+                lines.append(f"# TYPE {name} {kind}")
+
+        for key, value in sorted(self.counters.items()):
+            name, brace, labels = key.partition("{")
+            declare(f"check_aprs_{name}_total", "counter")
+            lines.append(f"check_aprs_{name}_total{brace}{labels} {value}")
+
+        for key, gauge in sorted(self.gauges.items()):
+            name, brace, labels = key.partition("{")
+            declare(f"check_aprs_{name}", "gauge")
+            lines.append(f"check_aprs_{name}{brace}{labels} {gauge()}")
+
+        for key, histogram in sorted(self.histograms.items()):
+            name, brace, labels = key.partition("{")
+            name, labels = f"check_aprs_{name}", brace + labels
+            declare(name, "histogram")
+            cumulative = 0
+            for le, count in zip(
+                [*histogram.buckets, "+Inf"], histogram.counts, strict=True
+            ):
+                cumulative += count
+                le_labels = f'{labels[:-1]},le="{le}"}}' if labels else f'{{le="{le}"}}'
+                lines.append(f"{name}_bucket{le_labels} {cumulative}")
+            lines.append(f"{name}_sum{labels} {histogram.sum}")
+            lines.append(f"{name}_count{labels} {histogram.count}")
+
+        return "\n".join(lines) + "\n"
+
+    async def monitor_loop_lag(self, interval: float = 1):
+        "Measure how late the event loop wakes up from a sleep"
+        while True:
+            start = time.monotonic()
+            await asyncio.sleep(interval)
+            self.observe("event_loop_lag_seconds", time.monotonic() - start - interval)
+
+
+class Trace:
+    "Times the processing stages of one sampled packet"
+
+    __slots__ = ("metrics", "type", "last")
+
+    BUCKETS = (1e-5, 5e-5, 1e-4, 5e-4, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5)
+
+    def __init__(self, metrics: Metrics):
+        self.metrics = metrics
+        self.type = "unknown"
+        self.last = time.perf_counter()
+
+    def mark(self, stage: str):
+        "Record the time since the previous mark as the duration of `stage`"
+        now = time.perf_counter()
+        self.metrics.observe(
+            f'trace_seconds{{stage="{stage}",type="{self.type}"}}',
+            now - self.last,
+            self.BUCKETS,
+        )
+        self.last = now
+
+
+@dataclasses.dataclass
+class Tracer:
+    "Starts a Trace for one in every `sample` matched packets"
+
+    metrics: Metrics
+    sample: int = 0  # 0 disables tracing
+    count: int = 0
+
+    def start(self) -> Trace | None:
+        if not self.sample:
+            return None
+        self.count += 1
+        if self.count % self.sample:
+            return None
+        return Trace(self.metrics)
+
+    def summary(self) -> dict[str, dict[str, dict[str, float]]]:
+        "Per-stage, per-packet-type timing statistics, in seconds"
+        stages = collections.defaultdict(dict)
+        for series, histogram in self.metrics.histograms.items():
+            if not series.startswith("trace_seconds{") or not histogram.count:
+                continue
+            labels = dict(re.findall(r'(\w+)="([^"]*)"', series))
+            stages[labels["stage"]][labels["type"]] = {
+                "count": histogram.count,
+                "mean": histogram.sum / histogram.count,
+                "p50": histogram.quantile(0.5),
+                "p99": histogram.quantile(0.99),
+            }
+        return stages
+
+
+# the trace of the packet being handled, read by submit_check
+current_trace: contextvars.ContextVar[Trace | None] = contextvars.ContextVar(
+    "current_trace", default=None
+)
+
+
+@dataclasses.dataclass
+class Heartbeat:
+    """Debounces the check_aprs result.
+
+    Packets only record their arrival time; the result is flushed once per
+    interval if any packets arrived, or immediately on the first packet after a
+    silent interval. A silent feed therefore sends nothing, and Icinga's
+    freshness checking still catches it.
+    """
+
+    listener: "APRSListener"
+    interval: float
+    last_packet: datetime.datetime | None = None
+    pending: bool = False
+    idle: bool = True
+    wakeup: asyncio.Event = dataclasses.field(default_factory=asyncio.Event)
+
+    def beat(self):
+        self.last_packet = datetime.datetime.now()
+        self.pending = True
+        if self.idle:
+            self.idle = False
+            self.wakeup.set()
+
+    async def run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), self.interval)
+            except TimeoutError:
+                pass
+            self.wakeup.clear()
+
+            if self.pending:
+                self.pending = False
+                await self.listener.submit_ping(self.last_packet)
+            else:
+                self.idle = True
+
+
+class Overflow(enum.StrEnum):
+    "What the dispatcher does with a new job when its queue is full"
+
+    BLOCK = "block"
+    DROP_OLDEST = "drop-oldest"
+    DROP_NEWEST = "drop-newest"
+
+
+class Lane(asyncio.Queue):
+    "A dispatcher queue of (enqueue time, job, droppable) items"
+
+    def evict(self) -> bool:
+        "Remove the oldest droppable job, returning False if there is none"
+        for item in self._queue:
+            if item[2]:
+                self._queue.remove(item)
+                self.task_done()
+                return True
+        return False
+
+
+@dataclasses.dataclass
+class Dispatcher:
+    """Runs jobs on a fixed number of lanes, each with its own bounded queue.
+
+    Jobs are assigned to a lane by a stable hash of their key, so jobs with the
+    same key (e.g. a callsign) run in submission order, while different keys
+    run concurrently across lanes. The overflow policy only applies to
+    droppable jobs; the rest wait for room and are never evicted.
+    """
+
+    metrics: Metrics
+    lanes: int = 4
+    maxsize: int = 1000
+    overflow: Overflow = Overflow.BLOCK
+
+    def __post_init__(self):
+        self.queues = [Lane(self.maxsize) for _ in range(self.lanes)]
+        self.metrics.gauges["queue_depth"] = lambda: sum(q.qsize() for q in self.queues)
+        for lane, queue in enumerate(self.queues):
+            self.metrics.gauges[f'lane_depth{{lane="{lane}"}}'] = queue.qsize
+
+    async def submit(
+        self, key: str, job: Callable[[], Awaitable], droppable: bool = True
+    ):
+        queue = self.queues[zlib.crc32(key.encode()) % self.lanes]
+        item = (time.monotonic(), job, droppable)
+        if self.overflow is Overflow.BLOCK or not droppable:
+            await queue.put(item)
+            return
+
+        if queue.full():
+            self.metrics.inc("queue_dropped")
+            if self.overflow is Overflow.DROP_NEWEST or not queue.evict():
+                return
+        queue.put_nowait(item)
+
+    async def worker(self, queue: Lane):
+        while True:
+            enqueued, job, _ = await queue.get()
+            waited = time.monotonic() - enqueued
+            self.metrics.observe("queue_wait_seconds", waited)
+            try:
+                await job()
+            except Exception:
+                log.exception("Error running job")
+            finally:
+                queue.task_done()
+
+    async def run(self):
+        async with asyncio.TaskGroup() as tg:
+            for queue in self.queues:
+                tg.create_task(self.worker(queue))
+
+    async def join(self):
+        for queue in self.queues:
+            await queue.join()
+
+
+@dataclasses.dataclass(slots=True)
+class Packet:
+    """The parts of an APRS packet that check_aprs uses.
+
+    Built straight from the raw line by parse_packet for the common formats,
+    or from an aprs3 frame for everything else.
+    """
+
+    source: str
+    # aprs3 DataType name, e.g. "TELEMETRY_DATA"
+    data_type: str
+    # None for packets aprs3 decodes without a comment
+    comment: bytes | None
+    # (latitude, longitude) of a position report
+    position: tuple[float, float] | None = None
+
+    @classmethod
+    def from_frame(cls, frame: aprs.APRSFrame) -> "Packet":
+        source = normalize_source(str(frame.source).encode("latin-1"))
+        packet = cls(source.decode("latin-1"), frame.info.data_type.name, None)
+        match frame.info:
+            case aprs.PositionReport(_position=position, comment=comment):
+                packet.comment = comment
+                packet.position = (float(position.lat), float(position.long))
+            case aprs.StatusReport(status=status):
+                packet.comment = status
+            case aprs.Message(data=data):
+                # aprs3 splits messages into addressee and text, leaving the
+                # comment empty; keep them together as on the wire
+                packet.comment = data
+            case aprs.InformationField(comment=comment):
+                packet.comment = comment
+        return packet
+
+
+# aprs3 data type names by identifier byte, so that packets from the fast
+# parser are labelled the same as decoded ones
+DATA_TYPE_NAMES = {
+    data_type.value: data_type.name
+    for data_type in aprs.DataType
+    if isinstance(data_type.value, bytes)
+}
+# uncompressed "DDMM.mmN/DDDMM.mmW$" position, without ambiguity
+POSITION = re.compile(rb"(\d\d)(\d\d\.\d\d)([NS]).(\d{3})(\d\d\.\d\d)([EW])([^_])")
+# course/speed, PHG, RNG and DFS extensions, which aprs3 may split out of the
+# comment (PHG and DFS whether or not they are well formed)
+DATA_EXTENSION = re.compile(rb"\d{3}/\d{3}|PHG.{4}|RNG\d{4}|DFS.{4}")
+STATUS_TIMESTAMP = re.compile(rb"\d{6}z")
+
+
+def normalize_source(source: bytes) -> bytes:
+    """A source callsign as aprs3 decodes it.
+
+    That is upper case, without a zero SSID, and without leading zeros in
+    the SSID, e.g. "n0call-01" becomes "N0CALL-1" and "N0CALL-0" "N0CALL".
+    """
+    source = source.upper()
+    call, dash, ssid = source.partition(b"-")
+    if dash and ssid.isdigit():
+        ssid = ssid.lstrip(b"0")
+        return call + b"-" + ssid if ssid else call
+    return source
+
+
+def parse_packet(line: bytes) -> Packet | None:
+    """Parse a raw TNC2 line without aprs3, for the formats handled here.
+
+    These are uncompressed position reports (not weather), telemetry, station
+    capabilities, messages and statuses without a timestamp. Returns None
+    for anything else, which should be decoded with aprs3 instead.
+    """
+    header, sep, info = line.partition(b":")
+    data_type = DATA_TYPE_NAMES.get(info[:1])
+    end = header.find(b">")
+    if not sep or data_type is None or end <= 0:
+        return None
+    source = normalize_source(header[:end]).decode("latin-1")
+
+    dti = info[0]
+    if dti in b"!=/@":
+        match = POSITION.match(info, 8 if dti in b"/@" else 1)
+        if match is None or DATA_EXTENSION.match(info, match.end()):
+            return None
+        lat_deg, lat_min, ns, lon_deg, lon_min, ew, _symbol = match.groups()
+        lat_min, lon_min = float(lat_min), float(lon_min)
+        lat = int(lat_deg) + lat_min / 60
+        lon = int(lon_deg) + lon_min / 60
+        # leave invalid positions to aprs3, and 90 degrees latitude too, which
+        # aprs3 only tries to read as a compressed position
+        if lat_min >= 60 or lon_min >= 60 or lat >= 90 or lon > 180:
+            return None
+        return Packet(
+            source,
+            data_type,
+            info[match.end() :],
+            (-lat if ns == b"S" else lat, -lon if ew == b"W" else lon),
+        )
+    if dti in b"T<:" or dti == ord(">") and not STATUS_TIMESTAMP.match(info, 1):
+        return Packet(source, data_type, info[1:])
+    return None
+
+
+class Status(enum.IntEnum):
+    "Service states, as Icinga exit statuses"
+
+    OK = 0
+    WARNING = 1
+    CRITICAL = 2
+    UNKNOWN = 3
+
+
+@dataclasses.dataclass
+class CheckResult:
+    "A passive check result for one service of a monitored station"
+
+    callsign: str
+    host: str
+    service: str
+    exit_status: int
+    plugin_output: str
+    performance_data: list[str] | None = None
+    trace: Trace | None = dataclasses.field(default=None, compare=False, repr=False)
+    # what is_redundant compared, recorded for the host once Icinga accepts it
+    fingerprint: tuple | None = dataclasses.field(
+        default=None, compare=False, repr=False
+    )
+
+
+def encode_json_stdlib(value) -> bytes:
+    return json.dumps(value, separators=(",", ":")).encode()
+
+
+def encode_string_stdlib(value: str) -> bytes:
+    return json.encoder.encode_basestring_ascii(value).encode()
+
+
+if orjson is not None:
+    encode_json = encode_string = orjson.dumps
+else:
+    encode_json, encode_string = encode_json_stdlib, encode_string_stdlib
+
+
+@dataclasses.dataclass
+class PayloadBuilder:
+    """Encodes process-check-result request bodies for check results.
+
+    The part of each request that is the same for every result of a service
+    is encoded once and cached as bytes, and only the exit status, output and
+    perfdata strings are encoded per result and spliced in.
+    """
+
+    encode: Callable[[str], bytes] = encode_string
+    prefixes: dict[tuple[str, str], bytes] = dataclasses.field(default_factory=dict)
+
+    def build(self, result: CheckResult) -> bytes:
+        key = (result.host, result.service)
+        prefix = self.prefixes.get(key)
+        if prefix is None:
+            prefix = self.prefixes[key] = b"".join(
+                [
+                    b'{"type":"Service","check_source":"APRSIS","service":',
+                    self.encode(f"{result.host}!{result.service}"),
+                    b',"exit_status":',
+                ]
+            )
+
+        parts = [
+            prefix,
+            b"%d" % result.exit_status,
+            b',"plugin_output":',
+            self.encode(result.plugin_output),
+        ]
+        if result.performance_data is not None:
+            parts += [
+                b',"performance_data":[',
+                b",".join([self.encode(p) for p in result.performance_data]),
+                b"]",
+            ]
+        parts.append(b"}")
+        return b"".join(parts)
+
+
+@dataclasses.dataclass
+class Coalescer:
+    """Latest-wins buffer for check results.
+
+    The first result for a (callsign, service) key opens a window; results
+    for the same key arriving within it replace the pending one, and only the
+    newest is sent when the window closes. Sends go back through the
+    dispatcher on the callsign's lane, preserving per-station ordering.
+    """
+
+    dispatcher: Dispatcher
+    send: Callable[[CheckResult], Awaitable]
+    metrics: Metrics
+    window: float = 5
+    pending: dict[tuple[str, str], tuple[float, CheckResult]] = dataclasses.field(
+        default_factory=dict
+    )
+    wakeup: asyncio.Event = dataclasses.field(default_factory=asyncio.Event)
+
+    def __post_init__(self):
+        self.metrics.gauges["coalesce_pending"] = self.pending.__len__
+
+    async def submit(self, result: CheckResult):
+        if self.window == 0:
+            await self.send(result)
+            return
+
+        key = (result.callsign, result.service)
+        if key in self.pending:
+            self.metrics.inc("superseded")
+            # keep the original deadline (and dict position) for this key
+            self.pending[key] = (self.pending[key][0], result)
+        else:
+            self.pending[key] = (time.monotonic() + self.window, result)
+            self.wakeup.set()
+
+    async def run(self):
+        # keys are inserted in deadline order, so the first one is due first
+        while True:
+            if not self.pending:
+                self.wakeup.clear()
+                await self.wakeup.wait()
+                continue
+
+            key, (deadline, result) = next(iter(self.pending.items()))
+            delay = deadline - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+                continue
+
+            del self.pending[key]
+            # the result already stands in for every packet it coalesced, so
+            # it must not be lost to the overflow policy
+            await self.dispatcher.submit(
+                result.callsign, functools.partial(self.send, result), droppable=False
+            )
+
+
+class Spool:
+    """Undelivered check results, waiting for Icinga to come back.
+
+    Holds at most one result per (host, service) -- the latest -- in the order
+    the keys first failed, bounded to maxsize keys with the oldest dropped
+    first. With a path, every change is appended to a write-ahead log there,
+    which is replayed on startup and compacted to the live entries whenever it
+    grows well past them.
+    """
+
+    def __init__(
+        self, metrics: Metrics, path: pathlib.Path | None = None, maxsize=10_000
+    ):
+        self.metrics = metrics
+        self.path = path
+        self.maxsize = maxsize
+        self.entries: collections.OrderedDict[tuple[str, str], CheckResult] = (
+            collections.OrderedDict()
+        )
+        self.nonempty = asyncio.Event()
+        self.file = None
+        self.logged = 0
+        if path is not None:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            if path.exists():
+                self.load()
+            self.compact()
+        if self.entries:
+            log.info("Loaded %d spooled check results", len(self.entries))
+            self.nonempty.set()
+        metrics.gauges["spool_entries"] = self.entries.__len__
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, result: CheckResult):
+        return (result.host, result.service) in self.entries
+
+    def load(self):
+        with self.path.open() as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # a torn final write from a crash; everything before it stands
+                    log.warning("Ignoring corrupt spool record in %s", self.path)
+                    continue
+                key = tuple(record["key"])
+                if "result" in record:
+                    self.entries[key] = CheckResult(**record["result"])
+                else:
+                    self.entries.pop(key, None)
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+    def write(self, record: dict):
+        if self.file is None:
+            return
+        self.file.write(json.dumps(record) + "\n")
+        self.file.flush()
+        self.logged += 1
+        if self.logged > 2 * len(self.entries) + 1000:
+            self.compact()
+
+    def compact(self):
+        "Rewrite the log to hold only the live entries"
+        if self.file is not None:
+            self.file.close()
+        tmp = self.path.with_suffix(".tmp")
+        with tmp.open("w") as f:
+            for key, result in self.entries.items():
+                f.write(json.dumps(self.record(key, result)) + "\n")
+        tmp.replace(self.path)
+        self.file = self.path.open("a")
+        self.logged = len(self.entries)
+
+    @staticmethod
+    def record(key: tuple[str, str], result: CheckResult) -> dict:
+        fields = dataclasses.asdict(
+            dataclasses.replace(result, trace=None, fingerprint=None)
+        )
+        del fields["trace"], fields["fingerprint"]
+        return {"key": key, "result": fields}
+
+    def put(self, result: CheckResult):
+        key = (result.host, result.service)
+        if key in self.entries:
+            self.metrics.inc("spool_superseded")
+        elif len(self.entries) >= self.maxsize:
+            dropped, _ = self.entries.popitem(last=False)
+            self.metrics.inc("spool_dropped")
+            self.write({"key": dropped})
+        self.metrics.inc("spooled")
+        self.entries[key] = result
+        self.write(self.record(key, result))
+        self.nonempty.set()
+
+    def first(self) -> CheckResult:
+        return next(iter(self.entries.values()))
+
+    def remove(self, result: CheckResult):
+        "Remove `result`, unless it has been superseded since it was taken"
+        key = (result.host, result.service)
+        if self.entries.get(key) is result:
+            del self.entries[key]
+            self.write({"key": key})
+        if not self.entries:
+            self.nonempty.clear()
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+class BreakerState(enum.IntEnum):
+    "Circuit breaker states, numbered for the icinga_circuit_state gauge"
+
+    CLOSED = 0
+    HALF_OPEN = 1
+    OPEN = 2
+
+    def __str__(self):
+        return self.name.lower().replace("_", "-")
+
+
+class CircuitOpen(Exception):
+    "The request wasn't attempted, because Icinga has been failing"
+
+
+@dataclasses.dataclass
+class IcingaClient:
+    """Adaptive concurrency limit and circuit breaker for Icinga API calls.
+
+    Requests in flight are capped by a limit that grows by about one per
+    round of fast, successful requests, and halves when one fails or takes
+    longer than latency_target. After failure_threshold consecutive failures
+    the breaker opens and requests fail fast with CircuitOpen; once
+    reset_timeout has passed a single probe is let through, which closes the
+    breaker again if it succeeds.
+    """
+
+    session: aiohttp.ClientSession
+    metrics: Metrics
+    max_concurrency: int = 16
+    latency_target: float = 1
+    failure_threshold: int = 5
+    reset_timeout: float = 30
+    in_flight: int = 0
+    state: BreakerState = BreakerState.CLOSED
+    failures: int = 0
+    opened: float = 0
+    last_decrease: float = 0
+    slots: asyncio.Condition = dataclasses.field(default_factory=asyncio.Condition)
+
+    def __post_init__(self):
+        self.limit = float(self.max_concurrency)
+        self.metrics.gauges["icinga_concurrency_limit"] = lambda: int(self.limit)
+        self.metrics.gauges["icinga_in_flight"] = lambda: self.in_flight
+        self.metrics.gauges["icinga_circuit_state"] = lambda: self.state.value
+
+    def describe(self) -> str:
+        return f"Icinga API circuit {self.state}, concurrency limit {int(self.limit)}"
+
+    @contextlib.asynccontextmanager
+    async def post(self, path: str, **kwargs):
+        if self.state is BreakerState.OPEN:
+            if time.monotonic() - self.opened < self.reset_timeout:
+                raise CircuitOpen()
+            self.transition(BreakerState.HALF_OPEN)
+        elif self.state is BreakerState.HALF_OPEN:
+            # only the probe is allowed through
+            raise CircuitOpen()
+
+        async with self.slots:
+            await self.slots.wait_for(lambda: self.in_flight < self.limit)
+            self.in_flight += 1
+        start = time.monotonic()
+        ok = False
+        try:
+            async with self.session.post(path, **kwargs) as r:
+                ok = r.status < 500
+                yield r
+        finally:
+            self.in_flight -= 1
+            self.record(ok, time.monotonic() - start)
+            async with self.slots:
+                self.slots.notify_all()
+
+    def record(self, ok: bool, latency: float):
+        now = time.monotonic()
+        if ok and latency <= self.latency_target:
+            self.limit = min(self.limit + 1 / self.limit, self.max_concurrency)
+        elif now - self.last_decrease >= self.latency_target:
+            # requests that were in flight together fail or stall together, so
+            # only halve once for them
+            self.limit = max(self.limit / 2, 1)
+            self.last_decrease = now
+
+        if ok:
+            self.failures = 0
+            if self.state is BreakerState.HALF_OPEN:
+                self.transition(BreakerState.CLOSED)
+        else:
+            self.failures += 1
+            if self.state is BreakerState.HALF_OPEN or (
+                self.state is BreakerState.CLOSED
+                and self.failures >= self.failure_threshold
+            ):
+                self.opened = now
+                self.transition(BreakerState.OPEN)
+
+    def transition(self, state: BreakerState):
+        log.log(
+            logging.INFO if state is BreakerState.CLOSED else logging.WARNING,
+            "Icinga API circuit is now %s",
+            state,
+        )
+        self.metrics.inc(f'icinga_circuit_transitions{{state="{state}"}}')
+        self.state = state
+
+
+class TimerWheel:
+    """Hierarchical timing wheel of keyed one-shot timers.
+
+    Level 0 has `size` slots of `resolution` seconds each, and every level
+    above has slots spanning a whole turn of the level below. A timer goes in
+    the lowest level whose range covers its deadline, so scheduling and
+    cancelling are O(1) whatever the number of timers; as time advances, the
+    timers in each coming slot of the upper levels cascade down a level, and
+    those in the current level 0 slot are due. Deadlines beyond a full turn of
+    the top level are clamped to it.
+    """
+
+    def __init__(
+        self, now: float, resolution: float = 1, size: int = 64, levels: int = 4
+    ):
+        self.resolution = resolution
+        self.size = size
+        # ticks covered by one slot of each level
+        self.spans = [size**level for level in range(levels)]
+        self.wheels: list[list[dict]] = [
+            [{} for _ in range(size)] for _ in range(levels)
+        ]
+        # key -> slot the key's timer is in
+        self.slots: dict = {}
+        self.tick = int(now / resolution)
+
+    def __len__(self):
+        return len(self.slots)
+
+    def schedule(self, key, deadline: float, payload=None):
+        "Set the timer for `key`, replacing any existing one"
+        self.cancel(key)
+        ticks = max(math.ceil(deadline / self.resolution), self.tick + 1)
+        ticks = min(ticks, self.tick + self.spans[-1] * self.size - 1)
+        self.insert(key, ticks, payload)
+
+    def cancel(self, key):
+        slot = self.slots.pop(key, None)
+        if slot is not None:
+            del slot[key]
+
+    def insert(self, key, ticks: int, payload):
+        delta = ticks - self.tick
+        level = 0
+        while level + 1 < len(self.spans) and delta >= self.spans[level + 1]:
+            level += 1
+        slot = self.wheels[level][ticks // self.spans[level] % self.size]
+        slot[key] = (ticks, payload)
+        self.slots[key] = slot
+
+    def advance(self, now: float) -> list[tuple]:
+        "Move time forward to `now`, returning (key, payload) for each due timer"
+        due = []
+        target = int(now / self.resolution)
+        while self.tick < target:
+            self.tick += 1
+            for level in range(1, len(self.spans)):
+                if self.tick % self.spans[level]:
+                    break
+                slot = self.wheels[level][self.tick // self.spans[level] % self.size]
+                timers = list(slot.items())
+                slot.clear()
+                for key, (ticks, payload) in timers:
+                    self.insert(key, ticks, payload)
+
+            slot = self.wheels[0][self.tick % self.size]
+            for key, (_ticks, payload) in slot.items():
+                del self.slots[key]
+                due.append((key, payload))
+            slot.clear()
+        return due
+
+
+class CallsignIndex:
+    """Maps callsigns to Icinga host names.
+
+    Callsigns ending in "-*" match every SSID of the base callsign. Lookups
+    take the raw source field of a packet as bytes, so packets can be matched
+    before they are decoded.
+    """
+
+    def __init__(self, hosts: dict[str, str] | None = None):
+        self.hosts = hosts or {}
+        self.exact: dict[bytes, str] = {}
+        self.wildcard: dict[bytes, str] = {}
+        for callsign, host in self.hosts.items():
+            if callsign.endswith("-*"):
+                self.wildcard[callsign[:-2].encode()] = host
+            else:
+                self.exact[callsign.encode()] = host
+
+    def __len__(self):
+        return len(self.hosts)
+
+    def __iter__(self):
+        return iter(self.hosts)
+
+    def match(self, source: bytes) -> str | None:
+        host = self.exact.get(source)
+        if host is None and self.wildcard:
+            host = self.wildcard.get(source.partition(b"-")[0])
+        return host
+
+    def get(self, callsign: str) -> str | None:
+        return self.match(callsign.encode())
+
+
+class Recorder:
+    """Writes raw APRS-IS lines to rotating gzip capture files.
+
+    Each line is stored as "<unix receive time> <raw line>". Writing happens on
+    a background thread, so recording never blocks the read loop; if the disk
+    can't keep up, lines beyond `maxsize` waiting to be written are dropped.
+    The file is flushed every `flush_interval` seconds, so a crash loses at
+    most that much, and only the newest `keep` files are kept (0 keeps all).
+    """
+
+    def __init__(
+        self,
+        directory: pathlib.Path,
+        metrics: Metrics,
+        rotate_interval: float = 3600,
+        keep: int = 168,
+        maxsize: int = 100_000,
+        flush_interval: float = 10,
+    ):
+        self.directory = directory
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.metrics = metrics
+        self.rotate_interval = rotate_interval
+        self.keep = keep
+        self.flush_interval = flush_interval
+        self.queue: queue.Queue[tuple[float, bytes] | None] = queue.Queue(maxsize)
+        metrics.gauges["recorder_queue"] = self.queue.qsize
+        self.thread = threading.Thread(target=self.write, daemon=True)
+        self.thread.start()
+
+    def record(self, line: bytes):
+        try:
+            self.queue.put_nowait((time.time(), line))
+        except queue.Full:
+            self.metrics.inc("recorder_dropped")
+
+    def write(self):
+        file = None
+        opened = flushed = 0.0
+        while True:
+            try:
+                item = self.queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                item = ...
+            if item is None:
+                break
+            if item is not ...:
+                timestamp, line = item
+                if file is None or timestamp - opened >= self.rotate_interval:
+                    if file is not None:
+                        file.close()
+                    opened = flushed = timestamp
+                    started = datetime.datetime.fromtimestamp(opened)
+                    path = self.directory / f"aprsis-{started:%Y%m%d-%H%M%S}.gz"
+                    file = gzip.open(path, "ab")
+                    self.prune()
+                file.write(b"%.6f %s\n" % (timestamp, line))
+            # a sync flush ends the deflate block, so everything written so far
+            # can be read back even if the file is never closed
+            if file is not None and time.time() - flushed >= self.flush_interval:
+                file.flush()
+                flushed = time.time()
+        if file is not None:
+            file.close()
+
+    def prune(self):
+        "Delete the oldest capture files beyond the newest `keep`"
+        if self.keep:
+            for path in sorted(self.directory.glob("aprsis-*.gz"))[: -self.keep]:
+                path.unlink(missing_ok=True)
+
+    def close(self):
+        self.queue.put(None)
+        self.thread.join()
+
+
+def read_captures(paths: Iterable[pathlib.Path]) -> Iterable[tuple[float, bytes]]:
+    """Yield (receive time, raw line) pairs from capture files written by Recorder
+
+    A file left unclosed by a crash ends without a gzip trailer; the lines
+    flushed before the crash are still yielded.
+    """
+    for path in paths:
+        with gzip.open(path, "rb") as f:
+            try:
+                for entry in f:
+                    if not entry.endswith(b"\n"):
+                        break
+                    timestamp, _, line = entry.rstrip(b"\n").partition(b" ")
+                    yield float(timestamp), line
+            except EOFError:
+                log.warning("Capture %s is truncated", path)
+
+
+KEEPALIVE_TIME = re.compile(rb"(\d{1,2} \w{3} \d{4} \d{2}:\d{2}:\d{2}) GMT")
+
+
+def parse_keepalive(line: bytes) -> datetime.datetime | None:
+    """Server time from an APRS-IS keepalive comment.
+
+    e.g. "# aprsc 2.1.14-g5e22b37 16 Oct 2026 12:00:00 GMT T2TEST 1.2.3.4:14580"
+    """
+    match = KEEPALIVE_TIME.search(line)
+    if match is None:
+        return None
+    try:
+        return datetime.datetime.strptime(
+            match.group(1).decode(), "%d %b %Y %H:%M:%S"
+        ).replace(tzinfo=datetime.UTC)
+    except ValueError:
+        return None
+
+
+@dataclasses.dataclass
+class LagMonitor:
+    """Decides when a server's feed lags too far behind to keep using it.
+
+    Lag is measured from keepalive timestamps, which have one second resolution
+    and include any clock offset, so a failover needs `tolerance` consecutive
+    keepalives over the threshold. Lag that builds up while the reader is
+    `busy` handling lines is local backlog rather than the server's, and is
+    left out until it has been worked off.
+    """
+
+    threshold: float = 30
+    tolerance: int = 2
+    strikes: int = 0
+    lag: float = 0.0
+    # keepalive lag as read, and how much of it is local backlog
+    raw: float = 0.0
+    backlog: float = 0.0
+
+    def observe(
+        self, server_time: datetime.datetime, now: datetime.datetime, busy: float = 0
+    ) -> bool:
+        raw = (now - server_time).total_seconds()
+        self.backlog = max(0.0, self.backlog + min(raw - self.raw, busy))
+        self.raw = raw
+        self.lag = raw - self.backlog
+        if self.lag > self.threshold:
+            self.strikes += 1
+        else:
+            self.strikes = 0
+        return self.strikes >= self.tolerance
+
+
+async def race_login(
+    servers: list[tuple[str, int]],
+    login: bytes,
+    avoid: Iterable[tuple[str, int]] = (),
+    rotation: int = 0,
+    stagger: float = 0.25,
+    timeout: float = 10,
+) -> tuple[asyncio.StreamReader, asyncio.StreamWriter, tuple[str, int]]:
+    """Connect to the first APRS-IS server to accept a login.
+
+    Every address of every server in the pool is tried, happy eyeballs style:
+    attempts start `stagger` seconds apart and run in parallel, and the first
+    to receive a "# logresp" wins. Addresses are tried in sorted order,
+    rotated by `rotation` so that different connections prefer different
+    servers, and addresses in `avoid` are only tried if nothing else is
+    available.
+    """
+    loop = asyncio.get_running_loop()
+    addresses = []
+    for host, port in servers:
+        for *_, sockaddr in await loop.getaddrinfo(host, port, type=socket.SOCK_STREAM):
+            if (sockaddr[0], sockaddr[1]) not in addresses:
+                addresses.append((sockaddr[0], sockaddr[1]))
+    addresses.sort()
+    if addresses:
+        rotation %= len(addresses)
+        addresses = addresses[rotation:] + addresses[:rotation]
+    avoid = set(avoid)
+    addresses.sort(key=lambda address: address in avoid)
+
+    async def attempt(address: tuple[str, int], delay: float):
+        await asyncio.sleep(delay)
+        reader, writer = await asyncio.open_connection(*address)
+        try:
+            writer.write(login)
+            async with asyncio.timeout(timeout):
+                while not (line := await reader.readline()).startswith(b"# logresp"):
+                    if not line:
+                        raise ConnectionError(f"{address} closed before login")
+        except BaseException:
+            writer.close()
+            raise
+        return reader, writer, address
+
+    attempts = [
+        asyncio.create_task(attempt(address, i * stagger))
+        for i, address in enumerate(addresses)
+    ]
+    winner = None
+    try:
+        errors = []
+        for next_done in asyncio.as_completed(attempts):
+            try:
+                winner = await next_done
+                return winner
+            except (OSError, TimeoutError) as e:
+                errors.append(e)
+        raise ConnectionError(f"could not log in to any APRS-IS server: {errors!r}")
+    finally:
+        for task in attempts:
+            task.cancel()
+        # close any connection that finished alongside the winner
+        for result in await asyncio.gather(*attempts, return_exceptions=True):
+            if isinstance(result, tuple) and result is not winner:
+                result[1].close()
+
+
+class DedupCache:
+    """Remembers packet keys for `ttl` seconds.
+
+    Entries are kept in arrival order, so expired ones are dropped from the
+    front in amortised O(1), and the oldest are evicted early once `maxsize`
+    is reached, bounding memory however bursty the feed.
+    """
+
+    def __init__(self, ttl: float = 30, maxsize: int = 100_000):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.entries: collections.OrderedDict[int, float] = collections.OrderedDict()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def seen(self, key: int) -> bool:
+        "Whether `key` was seen within the TTL, recording it if not"
+        now = time.monotonic()
+        entries = self.entries
+        while entries:
+            oldest = next(iter(entries.values()))
+            if now - oldest < self.ttl:
+                break
+            entries.popitem(last=False)
+
+        if key in entries:
+            return True
+        entries[key] = now
+        if len(entries) > self.maxsize:
+            entries.popitem(last=False)
+        return False
+
+
+@dataclasses.dataclass
+class Shard:
+    """One APRS-IS connection, passing raw packet lines to a handler.
+
+    Connects to whichever server in the pool logs in first, and fails over to
+    another one when keepalives show the feed lagging, or stop arriving.
+    Redundant feeds of the same shard are `peers`, and avoid connecting to
+    the same server as each other.
+    """
+
+    index: int
+    feed: int
+    servers: list[tuple[str, int]]
+    command: str
+    on_line: Callable[[bytes], Awaitable]
+    metrics: Metrics
+    recorder: Recorder | None = None
+    lag_threshold: float = 30
+    peers: list["Shard"] = dataclasses.field(default_factory=list)
+    rotation: int = 0
+    server: tuple[str, int] | None = None
+    writer: asyncio.StreamWriter | None = None
+
+    # keepalives are normally sent every 20 seconds
+    STALL_TIMEOUT = 120
+
+    def __post_init__(self):
+        self.labels = f'shard="{self.index}",feed="{self.feed}"'
+        self.monitor = LagMonitor(self.lag_threshold)
+        self.metrics.gauges[f"aprsis_lag_seconds{{{self.labels}}}"] = (
+            lambda: self.monitor.lag
+        )
+
+    def set_command(self, command: str):
+        if command == self.command:
+            return
+        self.command = command
+        if self.writer is not None and not self.writer.is_closing():
+            self.writer.write(f"#{command}\r\n".encode())
+
+    async def run(self):
+        backoff = 1
+        avoid = set()
+        while True:
+            try:
+                # use a real passcode for TX
+                login = f"user KC1GDW pass -1 vers {SOFTWARE_VERSION}"
+                command = self.command
+                if command:
+                    login += f" {command}"
+                peer_servers = {peer.server for peer in self.peers if peer is not self}
+                reader, self.writer, self.server = await race_login(
+                    self.servers,
+                    f"{login}\r\n".encode(),
+                    avoid | peer_servers,
+                    self.rotation,
+                )
+                # the filter may have changed while logging in, when there was
+                # no writer for set_command to send it on
+                if self.command != command:
+                    self.writer.write(f"#{self.command}\r\n".encode())
+                log.info(
+                    "APRS-IS shard %d feed %d connected to %s:%d",
+                    self.index,
+                    self.feed,
+                    *self.server,
+                )
+                self.monitor = LagMonitor(self.lag_threshold)
+                backoff = 1
+                avoid = set()
+                await self.read(reader, self.server)
+                avoid = {self.server}
+            except (OSError, TimeoutError) as e:
+                log.warning(
+                    "APRS-IS shard %d feed %d failed: %r", self.index, self.feed, e
+                )
+            except Exception:
+                # e.g. the ValueError for a line over the StreamReader limit;
+                # nothing awaits this task, so reconnect rather than end it
+                log.exception("APRS-IS shard %d feed %d crashed", self.index, self.feed)
+            finally:
+                self.server = None
+                if self.writer is not None:
+                    self.writer.close()
+                    self.writer = None
+
+            self.metrics.inc(f"shard_reconnects{{{self.labels}}}")
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, 300)
+
+    async def read(self, reader: asyncio.StreamReader, server: tuple[str, int]):
+        "Handle lines until the connection closes or the feed should fail over"
+        loop = asyncio.get_running_loop()
+        # time spent in on_line since the last keepalive, during which lines
+        # back up in the socket however healthy the server is
+        busy = 0.0
+        async with asyncio.timeout(self.STALL_TIMEOUT) as stall:
+            async for line in reader:
+                line = line.rstrip(b"\r\n")
+                if line.startswith(b"#"):  # server comments and keepalives
+                    if self.recorder is not None:
+                        self.recorder.record(line)
+                    stall.reschedule(loop.time() + self.STALL_TIMEOUT)
+                    server_time = parse_keepalive(line)
+                    if server_time is None:
+                        continue
+                    # lag from a slow handler (e.g. dispatcher backpressure)
+                    # is our own; switching servers would only throw away the
+                    # buffered lines
+                    failover = self.monitor.observe(
+                        server_time, datetime.datetime.now(datetime.UTC), busy
+                    )
+                    busy = 0.0
+                    if failover:
+                        log.warning(
+                            "APRS-IS shard %d feed %d: %s:%d lagging by %.0fs, "
+                            "failing over",
+                            self.index,
+                            self.feed,
+                            *server,
+                            self.monitor.lag,
+                        )
+                        self.metrics.inc(f"shard_failovers{{{self.labels}}}")
+                        return
+                    continue
+                self.metrics.inc(f"shard_packets{{{self.labels}}}")
+                started = loop.time()
+                await self.on_line(line)
+                spent = loop.time() - started
+                busy += spent
+                # nor does the time spent handling the line count towards a stall
+                stall.reschedule(stall.when() + spent)
+
+
+@dataclasses.dataclass
+class APRSFeed:
+    """Manages the APRS-IS connections.
+
+    By default the monitored callsigns are split over several connections
+    with "b/" filters, each shard getting at most shard_size callsigns to keep
+    its filter command short. With a fixed feed_filter (empty for the full
+    feed), a single connection is used and callsigns are only matched locally.
+    All shards feed the same line handler.
+
+    `host` is a comma separated pool of "host[:port]" servers, each shard
+    connecting to whichever responds first. With a redundancy above one, each
+    shard is read from that many servers at once; the first copy of each
+    packet is passed on, and later copies are dropped.
+    """
+
+    host: str
+    shard_size: int
+    on_line: Callable[[bytes], Awaitable]
+    metrics: Metrics
+    port: int = 14580
+    feed_filter: str | None = None
+    recorder: Recorder | None = None
+    lag_threshold: float = 30
+    redundancy: int = 1
+    dedup_ttl: float = 30
+    # the redundant feeds of each shard, and their tasks
+    shards: list[list[tuple[Shard, asyncio.Task]]] = dataclasses.field(
+        default_factory=list
+    )
+
+    def __post_init__(self):
+        self.dedup = DedupCache(self.dedup_ttl)
+        self.metrics.gauges["dedup_entries"] = self.dedup.__len__
+        self.servers = []
+        for server in self.host.split(","):
+            host, _, port = server.strip().rpartition(":")
+            if not host or "]" in port:  # no port, or a bare IPv6 address
+                host, port = server.strip(), self.port
+            self.servers.append((host.strip("[]"), int(port)))
+
+    def set_callsigns(self, callsigns: Iterable[str]):
+        if self.feed_filter is not None:
+            commands = [f"filter {self.feed_filter}" if self.feed_filter else ""]
+        else:
+            # APRS-IS filters use a plain "*" wildcard
+            callsigns = sorted(
+                c[:-2] + "*" if c.endswith("-*") else c for c in callsigns
+            )
+            commands = [
+                f"filter b/{'/'.join(callsigns[i : i + self.shard_size])}"
+                for i in range(0, len(callsigns), self.shard_size)
+            ]
+
+        for feeds, command in zip(self.shards, commands):
+            for shard, _task in feeds:
+                shard.set_command(command)
+
+        for index in range(len(self.shards), len(commands)):
+            # spread shards over the pool at random, and their feeds over
+            # different servers
+            rotation = random.randrange(1 << 16)
+            peers = []
+            for feed in range(self.redundancy):
+                peers.append(
+                    Shard(
+                        index,
+                        feed,
+                        self.servers,
+                        commands[index],
+                        functools.partial(self.receive, feed),
+                        self.metrics,
+                        self.recorder,
+                        self.lag_threshold,
+                        peers,
+                        rotation + feed,
+                    )
+                )
+            self.shards.append(
+                [(shard, asyncio.create_task(shard.run())) for shard in peers]
+            )
+
+        for feeds in self.shards[len(commands) :]:
+            for _shard, task in feeds:
+                task.cancel()
+        del self.shards[len(commands) :]
+
+    async def receive(self, feed: int, line: bytes):
+        if self.redundancy > 1:
+            # the path differs between servers, so key on source and information
+            key = hash((line[: line.find(b">")], line[line.find(b":") :]))
+            if self.dedup.seen(key):
+                self.metrics.inc("feed_duplicates")
+                return
+            self.metrics.inc(f'feed_first_arrivals{{feed="{feed}"}}')
+
+        if self.recorder is not None:
+            self.recorder.record(line)
+        await self.on_line(line)
+
+    def close(self):
+        for feeds in self.shards:
+            for _shard, task in feeds:
+                task.cancel()
+        self.shards.clear()
+
+
+# telemetry units as stations commonly spell them, mapped to units Icinga
+# accepts in perfdata; anything else is kept in the perfdata label instead
+TELEMETRY_UNITS = {
+    "v": "V",
+    "volt": "V",
+    "volts": "V",
+    "mv": "mV",
+    "a": "A",
+    "amp": "A",
+    "amps": "A",
+    "ma": "mA",
+    "w": "W",
+    "watt": "W",
+    "watts": "W",
+    "mw": "mW",
+    "wh": "Wh",
+    "ah": "Ah",
+    "c": "degC",
+    "degc": "degC",
+    "deg.c": "degC",
+    "f": "degF",
+    "degf": "degF",
+    "deg.f": "degF",
+    "k": "K",
+    "%": "%",
+    "pct": "%",
+    "hz": "Hz",
+    "db": "dB",
+    "dbm": "dBm",
+    "s": "s",
+    "sec": "s",
+    "ms": "ms",
+}
+
+
+def quote_label(label: str) -> str:
+    "A perfdata label, quoted if needed"
+    label = label.replace("'", "").replace("=", "")
+    return f"'{label}'" if " " in label else label
+
+
+@dataclasses.dataclass
+class TelemetryDefinition:
+    """Channel names, units, scaling and bit senses for one station.
+
+    These arrive as separate PARM, UNIT, EQNS and BITS messages, stored here
+    as received. Every update recompiles the per-channel labels and
+    coefficients, so formatting a telemetry frame needs no parsing beyond the
+    frame itself.
+    """
+
+    parm: list[str] = dataclasses.field(default_factory=list)
+    unit: list[str] = dataclasses.field(default_factory=list)
+    eqns: list[str] = dataclasses.field(default_factory=list)
+    bits: list[str] = dataclasses.field(default_factory=list)
+
+    def __post_init__(self):
+        self.compile()
+
+    def compile(self):
+        # (label, a, b, c, unit) for value = a * raw ** 2 + b * raw + c
+        self.analog: list[tuple[str, float, float, float, str]] = []
+        for idx in range(5):
+            name = self.parm[idx].strip() if idx < len(self.parm) else ""
+            unit = self.unit[idx].strip() if idx < len(self.unit) else ""
+            uom = TELEMETRY_UNITS.get(unit.lower(), "")
+            if not name:
+                name = f"telem_analog{idx}"
+            if unit and not uom:
+                name = f"{name} ({unit})"
+            try:
+                a, b, c = map(float, self.eqns[idx * 3 : idx * 3 + 3])
+            except ValueError:
+                a, b, c = 0, 1, 0
+            self.analog.append((quote_label(name), a, b, c, uom))
+
+        sense = self.bits[0] if self.bits else "11111111"
+        # (bit index, label, value when active) for each named bit
+        self.digital = [
+            (idx, quote_label(name.strip()), sense[idx : idx + 1] or "1")
+            for idx, name in enumerate(self.parm[5:13])
+            if name.strip()
+        ]
+
+    def perfdata(self, seq: str, analog: list[str], bits: str) -> list[str]:
+        result = [f"telem_seq={seq}"]
+        for (label, a, b, c, uom), raw in zip(self.analog, analog):
+            try:
+                value = float(raw)
+            except ValueError:
+                result.append(f"{label}={raw}")
+                continue
+            result.append(f"{label}={a * value * value + b * value + c:.6g}{uom}")
+
+        if self.digital:
+            result += [
+                f"{label}={int(bits[idx : idx + 1] == active)}"
+                for idx, label, active in self.digital
+            ]
+        else:
+            result.append(f"telem_bits={bits}")
+        return result
+
+
+class TelemetryCache:
+    """Telemetry definitions by station, persisted to a JSON file if given.
+
+    Stations without definitions get unnamed, unscaled channels.
+    """
+
+    KINDS = {"PARM", "UNIT", "EQNS", "BITS"}
+
+    def __init__(self, path: pathlib.Path | None = None):
+        self.path = path
+        self.default = TelemetryDefinition()
+        self.definitions: dict[str, TelemetryDefinition] = {}
+        if path is not None and path.exists():
+            with path.open() as f:
+                self.definitions = {
+                    callsign: TelemetryDefinition(**definition)
+                    for callsign, definition in json.load(f).items()
+                }
+            log.info("Loaded telemetry definitions for %d stations", len(self))
+
+    def __len__(self):
+        return len(self.definitions)
+
+    def get(self, callsign: str) -> TelemetryDefinition:
+        return self.definitions.get(callsign, self.default)
+
+    def define(self, callsign: str, kind: str, values: list[str]):
+        definition = self.definitions.get(callsign)
+        if definition is None:
+            definition = self.definitions[callsign] = TelemetryDefinition()
+        if getattr(definition, kind.lower()) == values:
+            return
+        setattr(definition, kind.lower(), values)
+        definition.compile()
+        log.info("Telemetry %s for %s: %s", kind, callsign, ",".join(values))
+        self.save()
+
+    def save(self):
+        if self.path is None:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix(".tmp")
+        with tmp.open("w") as f:
+            json.dump(
+                {
+                    callsign: dataclasses.asdict(definition)
+                    for callsign, definition in self.definitions.items()
+                },
+                f,
+            )
+        tmp.replace(self.path)
+
+
+PERFDATA_VALUE = re.compile(r"[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?")
+
+
+def compile_range(spec: str) -> Callable[[float], bool]:
+    """Compile a Nagios threshold range into a function that returns whether a
+    value should alert.
+
+    "10" alerts outside 0..10, "10:" below 10, "~:10" above 10, "10:20"
+    outside 10..20, and "@10:20" inside 10..20.
+    """
+    spec = str(spec).strip()
+    inside = spec.startswith("@")
+    low, sep, high = spec.removeprefix("@").partition(":")
+    if not sep:
+        low, high = "0", low
+    low = -math.inf if low == "~" else float(low or 0)
+    high = float(high) if high else math.inf
+    if low > high:
+        raise ValueError(f"empty range {spec!r}")
+    if inside:
+        return lambda value: low <= value <= high
+    return lambda value: value < low or value > high
+
+
+@dataclasses.dataclass
+class Thresholds:
+    """Warning and critical ranges for a host's perfdata.
+
+    Configured in host.vars.aprs.thresholds as a dict from perfdata label to
+    Nagios ranges, e.g. {"Battery": {"warning": "11.5:", "critical": "11:"}}.
+    The ranges are compiled once, when the host vars change.
+    """
+
+    config: dict
+
+    def __post_init__(self):
+        # label -> (warning range, alert function, critical range, alert function)
+        self.rules: dict[str, tuple[str, Callable | None, str, Callable | None]] = {}
+        for label, ranges in self.config.items():
+            try:
+                warning = ranges.get("warning", "")
+                critical = ranges.get("critical", "")
+                self.rules[label] = (
+                    warning,
+                    compile_range(warning) if warning != "" else None,
+                    critical,
+                    compile_range(critical) if critical != "" else None,
+                )
+            except (AttributeError, ValueError) as e:
+                log.warning("Ignoring invalid threshold for %s: %r", label, e)
+
+    def evaluate(self, perfdata: list[str]) -> tuple[Status, list[str], list[str]]:
+        """Check perfdata against the ranges.
+
+        Returns the resulting status, the perfdata with the ranges appended
+        for Icinga to graph, and a description of each value that alerted.
+        """
+        status = Status.OK
+        annotated = []
+        problems = []
+        for item in perfdata:
+            label, _, value = item.partition("=")
+            rule = self.rules.get(label.strip("'"))
+            if rule is None:
+                annotated.append(item)
+                continue
+
+            warning, warning_alert, critical, critical_alert = rule
+            annotated.append(f"{item};{warning};{critical}")
+            number = PERFDATA_VALUE.match(value)
+            if number is None:
+                continue
+            number = float(number.group())
+            if critical_alert is not None and critical_alert(number):
+                status = Status.CRITICAL
+                problems.append(self.describe(item, critical))
+            elif warning_alert is not None and warning_alert(number):
+                status = max(status, Status.WARNING)
+                problems.append(self.describe(item, warning))
+        return status, annotated, problems
+
+    @staticmethod
+    def describe(item: str, spec: str) -> str:
+        "Describe a perfdata item that alerted on the range `spec`"
+        spec = str(spec).strip()
+        if spec.startswith("@"):
+            return f"{item} inside {spec.removeprefix('@')}"
+        return f"{item} outside {spec}"
+
+
+class Station:
+    """What the daemon knows about one monitored station.
+
+    Times are unix timestamps, so they stay meaningful across a restart.
+    """
+
+    __slots__ = (
+        "last_heard",
+        "interval",
+        "variance",
+        "samples",
+        "recent",
+        "counts",
+        "position",
+        "output",
+        "fingerprint",
+        "sent",
+    )
+
+    def __init__(self):
+        self.last_heard: float | None = None
+        # exponentially weighted mean and variance of the time between packets
+        self.interval: float | None = None
+        self.variance: float = 0
+        self.samples: int = 0
+        # ring buffer of the last RECENT intervals, for percentiles
+        self.recent: list[float] = []
+        # packets received by data type name
+        self.counts: collections.Counter[str] = collections.Counter()
+        # (latitude, longitude) of the last position report
+        self.position: tuple[float, float] | None = None
+        self.output: str | None = None
+        # fingerprint of the last check result delivered for the station, and when
+        self.fingerprint: tuple | None = None
+        self.sent: float = 0
+
+    RECENT = 16
+    MIN_INTERVAL = 60
+
+    def dump(self) -> dict:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    @classmethod
+    def load(cls, state: dict) -> "Station":
+        station = cls()
+        # snapshots from older versions may lack some fields
+        for name in cls.__slots__:
+            if name in state:
+                setattr(station, name, state[name])
+        station.counts = collections.Counter(station.counts)
+        if station.position is not None:
+            station.position = tuple(station.position)
+        if station.fingerprint is not None:
+            exit_status, output, perfdata = station.fingerprint
+            station.fingerprint = (exit_status, output, tuple(perfdata))
+        return station
+
+    def heard(self, now: float, alpha: float = 0.1):
+        interval = now - self.last_heard if self.last_heard is not None else None
+        self.last_heard = now
+        # packets sent in a burst (e.g. position, status and telemetry) are
+        # part of the same beacon, not a beacon every few seconds
+        if interval is not None and interval >= self.MIN_INTERVAL:
+            if self.interval is None:
+                self.interval = interval
+            else:
+                diff = interval - self.interval
+                self.interval += alpha * diff
+                self.variance = (1 - alpha) * (self.variance + alpha * diff * diff)
+            if len(self.recent) < self.RECENT:
+                self.recent.append(interval)
+            else:
+                self.recent[self.samples % self.RECENT] = interval
+            self.samples += 1
+
+    def interval_perfdata(self) -> list[str]:
+        if self.interval is None:
+            return []
+        recent = sorted(self.recent)
+        p95 = recent[math.ceil(0.95 * len(recent)) - 1]
+        return [
+            f"interval_avg={self.interval:.1f}s",
+            f"interval_p95={p95:.1f}s",
+            f"jitter={math.sqrt(self.variance):.1f}s",
+        ]
+
+
+class StationTable:
+    """Monitored stations by callsign.
+
+    With a path, the table is loaded from a JSON snapshot there at startup,
+    and snapshotted back by run() and on shutdown, so a restart doesn't
+    forget when stations were last heard or what was last sent for them.
+    """
+
+    def __init__(self, metrics: Metrics, path: pathlib.Path | None = None):
+        self.path = path
+        self.stations: dict[str, Station] = {}
+        if path is not None and path.exists():
+            with path.open() as f:
+                self.stations = {
+                    sys.intern(callsign): Station.load(state)
+                    for callsign, state in json.load(f).items()
+                }
+            log.info("Loaded state for %d stations", len(self.stations))
+        metrics.gauges["stations"] = self.stations.__len__
+
+    def items(self):
+        return self.stations.items()
+
+    def __getitem__(self, callsign: str) -> Station:
+        station = self.stations.get(callsign)
+        if station is None:
+            station = self.stations[sys.intern(callsign)] = Station()
+        return station
+
+    def snapshot(self):
+        if self.path is None:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix(".tmp")
+        with tmp.open("w") as f:
+            json.dump({c: station.dump() for c, station in self.stations.items()}, f)
+        tmp.replace(self.path)
+
+    async def run(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            self.snapshot()
 
 
 @dataclasses.dataclass
 class APRSListener:
     aprsis_host: str
     session: aiohttp.ClientSession
+    heartbeat_interval: float = 10
+    workers: int = 4
+    queue_size: int = 1000
+    overflow: Overflow = Overflow.BLOCK
+    coalesce_window: float = 5
+    refresh_interval: float = 300
+    shard_size: int = 50
+    aprsis_port: int = 14580
+    feed_filter: str | None = None
+    lag_threshold: float = 30
+    redundancy: int = 1
+    dedup_ttl: float = 30
+    record_dir: pathlib.Path | None = None
+    record_rotate: float = 3600
+    record_keep: int = 168
+    metrics_port: int | None = None
+    trace_sample: int = 0
+    inventory_interval: float = 300
+    inventory_debounce: float = 10
+    state_dir: pathlib.Path | None = None
+    spool_size: int = 10_000
+    spool_rate: float = 20
+    icinga_concurrency: int = 16
+    icinga_latency_target: float = 1
+    breaker_threshold: int = 5
+    breaker_reset: float = 30
+    snapshot_interval: float = 300
+    # used for stations without a beacon_interval var, until one is learned
+    beacon_interval: float = 1800
+    stale_warning: float = 2
+    stale_critical: float = 4
+    metrics: Metrics = dataclasses.field(default_factory=Metrics)
+    callsigns: CallsignIndex = dataclasses.field(default_factory=CallsignIndex)
+    # host name -> the host's "aprs" vars
+    host_vars: dict[str, dict] = dataclasses.field(default_factory=dict)
+    thresholds: dict[str, Thresholds] = dataclasses.field(default_factory=dict)
+    # host name -> valid aprs.beacon_interval var
+    beacon_intervals: dict[str, float] = dataclasses.field(default_factory=dict)
+    inventory_changed: asyncio.Event = dataclasses.field(default_factory=asyncio.Event)
+
+    def __post_init__(self):
+        self.heartbeat = Heartbeat(self, self.heartbeat_interval)
+        self.icinga = IcingaClient(
+            self.session,
+            self.metrics,
+            self.icinga_concurrency,
+            self.icinga_latency_target,
+            self.breaker_threshold,
+            self.breaker_reset,
+        )
+        self.tracer = Tracer(self.metrics, self.trace_sample)
+        self.dispatcher = Dispatcher(
+            self.metrics, self.workers, self.queue_size, self.overflow
+        )
+        self.coalescer = Coalescer(
+            self.dispatcher, self.send_check, self.metrics, self.coalesce_window
+        )
+        self.payloads = PayloadBuilder()
+        self.stations = StationTable(
+            self.metrics,
+            self.state_dir / "stations.json" if self.state_dir is not None else None,
+        )
+        # stale timers are per host, as a host with an "-*" callsign is fine
+        # as long as any of its SSIDs is still heard
+        self.staleness = TimerWheel(time.time())
+        # host -> the callsign it was last heard from, and the callsign whose
+        # station holds the last result submitted for it
+        self.heard_from: dict[str, str] = {}
+        self.sent_from: dict[str, str] = {}
+        # silence only counts from when this run started listening, not
+        # while the daemon was down
+        self.started = time.time()
+        self.telemetry = TelemetryCache(
+            self.state_dir / "telemetry.json" if self.state_dir is not None else None
+        )
+        self.spool = Spool(
+            self.metrics,
+            self.state_dir / "spool.jsonl" if self.state_dir is not None else None,
+            self.spool_size,
+        )
+        self.recorder = (
+            Recorder(
+                self.record_dir, self.metrics, self.record_rotate, self.record_keep
+            )
+            if self.record_dir is not None
+            else None
+        )
+        self.feed = APRSFeed(
+            self.aprsis_host,
+            self.shard_size,
+            self.dispatch_line,
+            self.metrics,
+            self.aprsis_port,
+            self.feed_filter,
+            self.recorder,
+            self.lag_threshold,
+            self.redundancy,
+            self.dedup_ttl,
+        )
 
     async def get_callsigns(self):
         async with self.session.get(
             "/v1/objects/hosts",
             params={"filter": "host.vars.aprs.callsign", "attrs": "vars"},
         ) as r:
-            return [
-                host["attrs"]["vars"]["aprs"]["callsign"]
+            # an error body has no "results"; raise a ClientError for callers
+            r.raise_for_status()
+            self.host_vars = {
+                host["name"]: host["attrs"]["vars"]["aprs"]
                 for host in (await r.json())["results"]
-            ]
+            }
+            self.callsigns = CallsignIndex(
+                {
+                    aprs_vars["callsign"]: host
+                    for host, aprs_vars in self.host_vars.items()
+                }
+            )
+            self.update_thresholds()
+            self.update_beacon_intervals()
+            return list(self.callsigns)
+
+    def update_thresholds(self):
+        "Recompile threshold rules for hosts whose configuration changed"
+        thresholds = {}
+        for host, aprs_vars in self.host_vars.items():
+            config = aprs_vars.get("thresholds")
+            if not isinstance(config, dict):
+                continue
+            cached = self.thresholds.get(host)
+            if cached is not None and cached.config == config:
+                thresholds[host] = cached
+            else:
+                thresholds[host] = Thresholds(config)
+        self.thresholds = thresholds
+
+    def update_beacon_intervals(self):
+        "Validate hosts' beacon_interval vars, so a bad one falls back to the default"
+        intervals = {}
+        for host, aprs_vars in self.host_vars.items():
+            if "beacon_interval" not in aprs_vars:
+                continue
+            value = aprs_vars["beacon_interval"]
+            try:
+                interval = float(value)
+            except (TypeError, ValueError):
+                interval = math.nan
+            if interval > 0:
+                intervals[host] = interval
+            else:
+                log.warning("Ignoring invalid beacon_interval %r for %s", value, host)
+        self.beacon_intervals = intervals
+
+    async def watch_inventory(self):
+        "Flag the callsign index as stale whenever a host object changes"
+        while True:
+            try:
+                async with self.session.post(
+                    "/v1/events",
+                    json={
+                        "types": ["ObjectCreated", "ObjectModified", "ObjectDeleted"],
+                        "queue": "check_aprs",
+                        "filter": 'event.object_type=="Host"',
+                    },
+                    timeout=aiohttp.ClientTimeout(total=None, sock_read=None),
+                ) as r:
+                    r.raise_for_status()
+                    # catch up on anything missed while not subscribed
+                    self.inventory_changed.set()
+                    async for _event in r.content:
+                        self.inventory_changed.set()
+            except aiohttp.ClientError as e:
+                log.warning("Icinga event stream failed: %r", e)
+
+            # fall back to polling until the event stream can be reopened
+            await asyncio.sleep(self.inventory_interval)
+            self.inventory_changed.set()
+
+    async def refresh_inventory(self):
+        while True:
+            await self.inventory_changed.wait()
+            # wait for changes to settle, so a bulk config deploy causes a
+            # single reload and filter update
+            while True:
+                self.inventory_changed.clear()
+                try:
+                    await asyncio.wait_for(
+                        self.inventory_changed.wait(), self.inventory_debounce
+                    )
+                except TimeoutError:
+                    break
+
+            old = set(self.callsigns)
+            try:
+                new = set(await self.get_callsigns())
+            except aiohttp.ClientError as e:
+                log.error("Failed to refresh callsigns: %r", e)
+                continue
+
+            if old == new:
+                continue
+            log.info(
+                "Callsigns added: %s; removed: %s",
+                ", ".join(sorted(new - old)) or "none",
+                ", ".join(sorted(old - new)) or "none",
+            )
+            self.metrics.inc("inventory_updates")
+            if new:
+                self.feed.set_callsigns(new)
+            else:
+                log.warning("No callsigns in Icinga, keeping old filter")
+
+    async def process_check_result(self, body: bytes, kind: str) -> int | None:
+        "Returns the HTTP status, or None if Icinga couldn't be reached"
+        start = time.monotonic()
+        status = "error"
+        try:
+            async with self.icinga.post(
+                "/v1/actions/process-check-result",
+                data=body,
+                headers={"Content-Type": "application/json"},
+            ) as r:
+                status = r.status
+                if r.status != 200:
+                    log.error("Icinga API error %d: %s", r.status, await r.text())
+                return r.status
+        except CircuitOpen:
+            status = "rejected"
+            return None
+        except (aiohttp.ClientError, TimeoutError) as e:
+            log.error("Icinga API request failed: %r", e)
+            return None
+        finally:
+            self.metrics.observe("icinga_request_seconds", time.monotonic() - start)
+            self.metrics.inc(f'icinga_requests{{kind="{kind}",status="{status}"}}')
 
-    async def submit_ping(self):
+    async def submit_ping(self, last_packet):
+        self.metrics.inc("pings")
+        # unless the breaker is closed, this only gets through as its probe
+        healthy = self.icinga.state is BreakerState.CLOSED
         data = {
             "type": "Service",
             "filter": 'service.name=="check_aprs"',
-            "exit_status": 0,
-            "plugin_output": f"OK: last packet recieved at {datetime.datetime.now()}",
+            "exit_status": 0 if healthy else 1,
+            "plugin_output": f"{'OK' if healthy else 'WARNING'}: last packet "
+            f"recieved at {last_packet}; {self.icinga.describe()}",
+            "performance_data": self.metrics.perfdata(),
             "check_source": "APRSIS",
         }
 
-        async with self.session.post(
-            "/v1/actions/process-check-result", json=data
-        ) as r:
-            # TODO: better error handling
-            if r.status != 200:
-                click.echo("Error:", r.text, err=True)
+        await self.process_check_result(encode_json(data), "ping")
 
     async def submit_check(self, callsign, message, performance_data=None):
-        data = {
-            "type": "Service",
-            "filter": f'service.name=="aprsis" && host.vars.aprs.callsign=="{callsign}"',
-            "exit_status": 0,
-            "plugin_output": f"OK: {message}",
-            "check_source": "APRSIS",
-        }
+        callsign = str(callsign)
+        host = self.callsigns.get(callsign)
+        if host is None:
+            self.metrics.inc("unknown_callsign")
+            log.warning("Ignoring packet from unknown callsign %s", callsign)
+            return
 
-        if performance_data is not None:
-            data["performance_data"] = performance_data
+        status = Status.OK
+        thresholds = self.thresholds.get(host)
+        if thresholds is not None and performance_data is not None:
+            status, performance_data, problems = thresholds.evaluate(performance_data)
+            if problems:
+                message = f"{message} ({', '.join(problems)})"
 
-        async with self.session.post(
-            "/v1/actions/process-check-result",
-            json=data,
-        ) as r:
-            # TODO: better error handling
-            if r.status != 200:
-                click.echo("Error:", r.text, err=True)
-
-    async def handle_packet(self, packet):
-        click.echo(packet.info)
-        await self.submit_ping()
-        match packet.info:
-            case aprs.PositionReport(_position=position, comment=comment):
+        trace = current_trace.get()
+        if trace is not None:
+            trace.mark("handle")
+        result = CheckResult(
+            callsign,
+            host,
+            "aprsis",
+            status,
+            f"{status.name}: {message}",
+            performance_data,
+            trace,
+        )
+        station = self.stations[callsign]
+        station.output = result.plugin_output
+        if self.is_redundant(result):
+            return
+        # added after the redundancy check, as they change with every packet
+        result.performance_data = [
+            *(result.performance_data or ()),
+            *station.interval_perfdata(),
+        ] or None
+        await self.coalescer.submit(result)
+
+    def expected_interval(self, host: str, station: Station) -> float:
+        "Seconds expected between packets from a host's station"
+        interval = self.beacon_intervals.get(host)
+        if interval is not None:
+            return interval
+        if station.interval is None:
+            return self.beacon_interval
+        return station.interval
+
+    def schedule_stale(self, host: str, station: Station, status: Status):
+        "Set the timer for a host to go into `status` if `station` is its last heard"
+        factor = self.stale_warning if status is Status.WARNING else self.stale_critical
+        deadline = max(station.last_heard, self.started) + factor * (
+            self.expected_interval(host, station)
+        )
+        self.staleness.schedule(host, deadline, status)
+
+    async def watch_staleness(self):
+        "Submit WARNING, then CRITICAL, results for stations that have gone silent"
+        while True:
+            await asyncio.sleep(self.staleness.resolution)
+            for host, status in self.staleness.advance(time.time()):
+                await self.submit_stale(host, status)
+
+    async def submit_stale(self, host: str, status: Status):
+        callsign = self.heard_from.get(host)
+        if callsign is None or self.callsigns.get(callsign) != host:
+            return  # no longer monitored
+        station = self.stations[callsign]
+        if status is Status.WARNING:
+            self.schedule_stale(host, station, Status.CRITICAL)
+
+        self.metrics.inc(f'stale{{status="{status.name}"}}')
+        silent = datetime.timedelta(seconds=round(time.time() - station.last_heard))
+        expected = datetime.timedelta(
+            seconds=round(self.expected_interval(host, station))
+        )
+        result = CheckResult(
+            callsign,
+            host,
+            "aprsis",
+            status,
+            f"{status.name}: not heard for {silent}, expected every {expected}",
+        )
+        if not self.is_redundant(result):
+            await self.coalescer.submit(result)
+
+    def is_redundant(self, result: CheckResult) -> bool:
+        """Whether `result` repeats the last one delivered for its host.
+
+        Repeats are still sent once refresh_interval has passed since the last
+        delivery, so Icinga's freshness checking doesn't fire for a station
+        that is beaconing an unchanged status.
+        """
+        result.fingerprint = (
+            result.exit_status,
+            result.plugin_output,
+            tuple(result.performance_data or ()),
+        )
+        sender = self.sent_from.get(result.host)
+        if sender is None:
+            return False
+        station = self.stations[sender]
+        if station.fingerprint == result.fingerprint:
+            if time.time() - station.sent < self.refresh_interval:
+                self.metrics.inc("suppressed")
+                return True
+            self.metrics.inc("forced_refresh")
+        return False
+
+    async def send_check(self, result: CheckResult):
+        # while an earlier result for the service is waiting in the spool,
+        # replace it rather than overtake it, so Icinga sees results in order
+        if result in self.spool or await self.deliver(result) is None:
+            self.spool.put(result)
+
+    async def deliver(self, result: CheckResult) -> bool | None:
+        """Send a check result to Icinga.
+
+        Returns whether Icinga accepted it, or None if it should be retried
+        later (Icinga unreachable or answering with a server error).
+        """
+        body = self.payloads.build(result)
+        self.metrics.inc("checks")
+        if result.trace is not None:
+            result.trace.mark("coalesce")
+        status = await self.process_check_result(body, "check")
+        if result.trace is not None:
+            result.trace.mark("icinga")
+        if status is None or status >= 500:
+            return None
+        # only now is it safe to suppress repeats, as results still queued or
+        # coalescing when the daemon stops are never sent
+        if status == 200 and result.fingerprint is not None:
+            station = self.stations[result.callsign]
+            station.fingerprint, station.sent = result.fingerprint, time.time()
+            self.sent_from[result.host] = result.callsign
+        return status == 200
+
+    async def drain_spool(self):
+        "Replay spooled check results, oldest first, at up to spool_rate per second"
+        backoff = 1
+        while True:
+            await self.spool.nonempty.wait()
+            result = self.spool.first()
+            if await self.deliver(result) is None:
+                log.warning(
+                    "Icinga still unavailable, %d check results spooled",
+                    len(self.spool),
+                )
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, 60)
+                continue
+
+            backoff = 1
+            self.metrics.inc("spool_replayed")
+            self.spool.remove(result)
+            await asyncio.sleep(1 / self.spool_rate)
+
+    async def dispatch_line(self, line: bytes):
+        # match the raw source field first, so that unmonitored packets in a
+        # full feed are dropped without being decoded
+        source = normalize_source(line[: line.find(b">")])
+        if self.callsigns.match(source) is None:
+            self.metrics.inc("packets_unmatched")
+            return
+        self.metrics.inc("packets_matched")
+
+        # sample among matched packets only, or a full feed would leave almost
+        # no traces for the stations that are actually monitored
+        trace = self.tracer.start()
+
+        packet = parse_packet(line)
+        if packet is None:
+            self.metrics.inc("packets_aprs3_decoded")
+            try:
+                frame = aprs.APRSFrame.from_str(line.decode("latin-1"))
+                packet = Packet.from_frame(frame)
+            except Exception as e:
+                self.metrics.inc("packets_undecodable")
+                log.warning("Failed to decode %r: %r", line, e)
+                return
+
+        if trace is not None:
+            trace.type = packet.data_type
+            trace.mark("decode")
+
+        if packet_log.isEnabledFor(logging.DEBUG):
+            packet_log.debug(
+                "%s", packet, extra={"fields": {"line": line.decode("latin-1")}}
+            )
+        await self.dispatcher.submit(
+            source.decode("latin-1"),
+            functools.partial(self.handle_packet, packet, trace),
+        )
+
+    async def handle_packet(self, packet: Packet, trace: Trace | None = None):
+        if trace is not None:
+            trace.mark("queue")
+        token = current_trace.set(trace)
+        try:
+            await self.match_packet(packet)
+        finally:
+            current_trace.reset(token)
+
+    async def match_packet(self, packet: Packet):
+        self.metrics.inc("packets")
+        self.metrics.inc(f'packets_received{{type="{packet.data_type}"}}')
+        self.heartbeat.beat()
+        station = self.stations[packet.source]
+        station.heard(time.time())
+        station.counts[packet.data_type] += 1
+        host = self.callsigns.get(packet.source)
+        if host is not None:
+            self.heard_from[host] = packet.source
+            self.schedule_stale(host, station, Status.WARNING)
+        match packet:
+            case Packet(comment=None):
+                pass
+
+            case Packet(position=(_lat, _lon) as position, comment=comment):
+                station.position = position
                 await self.submit_check(packet.source, comment.decode("ascii"))
 
-            case aprs.InformationField(
-                comment=comment, data_type=aprs.DataType.TELEMETRY_DATA
+            case Packet(
+                data_type="TELEMETRY_DATA", comment=comment
             ) if comment.startswith(b"#"):
                 seq, *analog, bits = comment[1:].decode("ascii").split(",")
-                telem = [
-                    f"telem_seq={seq}",
-                    *[f"telem_analog{idx}={a}" for idx, a in enumerate(analog)],
-                    f"telem_bits={bits}",
-                ]
+                telem = self.telemetry.get(packet.source).perfdata(seq, analog, bits)
                 await self.submit_check(packet.source, comment.decode("ascii"), telem)
 
-            case aprs.InformationField(
-                comment=comment, data_type=aprs.DataType.STATION_CAPABILITIES
+            case Packet(data_type="MESSAGE", comment=comment) if (
+                comment[9:10] == b":"
+                and comment[14:15] == b"."
+                and comment[10:14].decode("ascii", "replace") in TelemetryCache.KINDS
+            ):
+                # telemetry definitions are addressed to the station they describe
+                addressee = comment[:9].decode("ascii").strip()
+                values = comment[15:].decode("ascii").partition("{")[0].split(",")
+                self.telemetry.define(addressee, comment[10:14].decode(), values)
+                await self.submit_check(packet.source, comment.decode("ascii"))
+
+            case Packet(
+                data_type="STATION_CAPABILITIES", comment=comment
             ) if comment.startswith(b"IGATE,"):
                 # IGate StatusBeacon, should be comma seperated "key=value" fields
                 igate_stats = comment.decode("ascii").split(",")[1:]
@@ -87,28 +2352,129 @@ class APRSListener:
                     packet.source, comment.decode("ascii"), igate_stats
                 )
 
-            case aprs.InformationField(comment=comment):
+            case Packet(comment=comment):
                 await self.submit_check(packet.source, comment.decode("ascii"))
 
+    def restore_hosts(self):
+        "Find each host's last heard and last sent station in a loaded snapshot"
+        heard: dict[str, float] = {}
+        sent: dict[str, float] = {}
+        for callsign, station in self.stations.items():
+            host = self.callsigns.get(callsign)
+            if host is None:
+                continue
+            if station.last_heard is not None and station.last_heard > heard.get(
+                host, -math.inf
+            ):
+                heard[host] = station.last_heard
+                self.heard_from[host] = callsign
+            if station.fingerprint is not None and station.sent > sent.get(
+                host, -math.inf
+            ):
+                sent[host] = station.sent
+                self.sent_from[host] = callsign
+
+    def resume_staleness(self):
+        "Pick up silence detection where a previous run left off"
+        # stations get their full window again from now
+        self.started = time.time()
+        self.restore_hosts()
+        for host, callsign in self.heard_from.items():
+            self.schedule_stale(host, self.stations[callsign], Status.WARNING)
+
     async def run(self):
         callsigns = await self.get_callsigns()
         if callsigns:
-            click.echo(f"Monitoring callsigns: {', '.join(callsigns)}")
+            log.info("Monitoring callsigns: %s", ", ".join(callsigns))
         else:
-            click.echo("No calligns defined in Icinga!")
+            log.error("No calligns defined in Icinga!")
             return
 
-        transport, protocol = await aprs.create_aprsis_connection(
-            host=self.aprsis_host,
-            port=14580,
-            user="KC1GDW",
-            passcode="-1",  # use a real passcode for TX
-            command=f"filter b/{'/'.join(callsigns)}",
+        self.feed.set_callsigns(callsigns)
+        self.resume_staleness()
+
+        try:
+            async with asyncio.TaskGroup() as tg:
+                tg.create_task(self.heartbeat.run())
+                tg.create_task(self.dispatcher.run())
+                tg.create_task(self.coalescer.run())
+                tg.create_task(self.drain_spool())
+                tg.create_task(self.watch_inventory())
+                tg.create_task(self.refresh_inventory())
+                tg.create_task(self.metrics.monitor_loop_lag())
+                tg.create_task(self.stations.run(self.snapshot_interval))
+                tg.create_task(self.watch_staleness())
+                if self.metrics_port is not None:
+                    tg.create_task(self.serve_metrics())
+        finally:
+            self.feed.close()
+            self.spool.close()
+            self.stations.snapshot()
+            if self.recorder is not None:
+                self.recorder.close()
+
+    async def serve_metrics(self):
+        app = web.Application()
+        app.router.add_get("/metrics", self.get_metrics)
+        app.router.add_get("/trace", self.get_trace)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        await web.TCPSite(runner, port=self.metrics_port).start()
+        try:
+            await asyncio.Future()  # serve until cancelled
+        finally:
+            await runner.cleanup()
+
+    async def get_metrics(self, _request: web.Request) -> web.Response:
+        return web.Response(
+            body=self.metrics.exposition().encode(),
+            headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"},
         )
 
-        async for packet in protocol.read():
-            click.echo(packet)
-            asyncio.create_task(self.handle_packet(packet))
+    async def get_trace(self, _request: web.Request) -> web.Response:
+        return web.json_response(self.tracer.summary())
+
+    async def drain(self):
+        "Wait until all queued packets and pending results have been submitted"
+        await self.dispatcher.join()
+        while self.coalescer.pending:
+            await asyncio.sleep(0.1)
+        await self.dispatcher.join()
+
+    async def replay(self, captures: list[pathlib.Path], speed: float):
+        """Feed recorded lines through the packet handler.
+
+        speed is a multiple of real time, or 0 to replay as fast as possible.
+        """
+        callsigns = await self.get_callsigns()
+        log.info("Replaying for callsigns: %s", ", ".join(callsigns))
+        self.restore_hosts()
+
+        async with asyncio.TaskGroup() as tg:
+            tasks = [
+                tg.create_task(self.heartbeat.run()),
+                tg.create_task(self.dispatcher.run()),
+                tg.create_task(self.coalescer.run()),
+                tg.create_task(self.drain_spool()),
+            ]
+
+            start = first = None
+            for timestamp, line in read_captures(captures):
+                if line.startswith(b"#"):
+                    continue
+                if speed:
+                    if start is None:
+                        start, first = time.monotonic(), timestamp
+                    delay = (timestamp - first) / speed - (time.monotonic() - start)
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+                await self.dispatch_line(line)
+
+            await self.drain()
+            for task in tasks:
+                task.cancel()
+        # anything still spooled is replayed by the next run with this state dir
+        self.spool.close()
 
 
 def validate_fingerprint(_ctx, _param, fingerprint: str):
@@ -118,14 +2484,23 @@ def validate_fingerprint(_ctx, _param, fingerprint: str):
         raise click.BadParameter("must be hexadecimal string (with or without colons)")
 
 
-@click.command(context_settings={"max_content_width": 120})
+@click.group(invoke_without_command=True, context_settings={"max_content_width": 120})
 @click.option(
     "--aprsis-host",
     envvar="APRSIS_HOST",
-    help="APRSIS hostname",
+    help="APRSIS server pool, as comma separated host[:port] (env: APRSIS_HOST)",
     default="noam.aprs2.net",
     show_default=True,
 )
+@click.option(
+    "--lag-threshold",
+    envvar="LAG_THRESHOLD",
+    help="Fail over to another APRS-IS server when its keepalives lag by more "
+    "than this many seconds (env: LAG_THRESHOLD)",
+    type=click.FloatRange(min=0, min_open=True),
+    default=30,
+    show_default=True,
+)
 @click.option(
     "--icinga-host",
     envvar="ICINGA_HOST",
@@ -152,18 +2527,400 @@ def validate_fingerprint(_ctx, _param, fingerprint: str):
     callback=validate_fingerprint,
     required=True,
 )
+@click.option(
+    "--redundancy",
+    envvar="REDUNDANCY",
+    help="Read each shard from this many APRS-IS servers at once, passing on "
+    "whichever copy of a packet arrives first (env: REDUNDANCY)",
+    type=click.IntRange(min=1),
+    default=1,
+    show_default=True,
+)
+@click.option(
+    "--dedup-ttl",
+    envvar="DEDUP_TTL",
+    help="Seconds to remember packets for dropping redundant copies "
+    "(env: DEDUP_TTL)",
+    type=click.FloatRange(min=0, min_open=True),
+    default=30,
+    show_default=True,
+)
+@click.option(
+    "--heartbeat-interval",
+    envvar="HEARTBEAT_INTERVAL",
+    help="Seconds between check_aprs heartbeat results (env: HEARTBEAT_INTERVAL)",
+    type=click.FloatRange(min=0, min_open=True),
+    default=10,
+    show_default=True,
+)
+@click.option(
+    "--workers",
+    envvar="WORKERS",
+    help="Number of ordered packet handler lanes, keyed by callsign (env: WORKERS)",
+    type=click.IntRange(min=1),
+    default=4,
+    show_default=True,
+)
+@click.option(
+    "--queue-size",
+    envvar="QUEUE_SIZE",
+    help="Maximum number of packets waiting in each lane (env: QUEUE_SIZE)",
+    type=click.IntRange(min=1),
+    default=1000,
+    show_default=True,
+)
+@click.option(
+    "--overflow",
+    envvar="OVERFLOW",
+    help="What to do with new packets when the queue is full (env: OVERFLOW)",
+    type=click.Choice([o.value for o in Overflow]),
+    callback=lambda _ctx, _param, value: Overflow(value),
+    default=Overflow.BLOCK.value,
+    show_default=True,
+)
+@click.option(
+    "--coalesce-window",
+    envvar="COALESCE_WINDOW",
+    help="Seconds to hold a station's result so newer ones can replace it, "
+    "0 to disable (env: COALESCE_WINDOW)",
+    type=click.FloatRange(min=0),
+    default=5,
+    show_default=True,
+)
+@click.option(
+    "--refresh-interval",
+    envvar="REFRESH_INTERVAL",
+    help="Seconds before an unchanged result is sent again, must be below the "
+    "freshness threshold of the aprsis services (env: REFRESH_INTERVAL)",
+    type=click.FloatRange(min=0),
+    default=300,
+    show_default=True,
+)
+@click.option(
+    "--shard-size",
+    envvar="SHARD_SIZE",
+    help="Maximum callsigns per APRS-IS connection (env: SHARD_SIZE)",
+    type=click.IntRange(min=1),
+    default=50,
+    show_default=True,
+)
+@click.option(
+    "--full-feed",
+    envvar="FULL_FEED",
+    help="Read the unfiltered full feed (port 10152) and match callsigns locally "
+    "(env: FULL_FEED)",
+    is_flag=True,
+)
+@click.option(
+    "--feed-filter",
+    envvar="FEED_FILTER",
+    help="Server-side filter (e.g. a range filter for a regional feed) to use "
+    "instead of per-callsign filters, matching callsigns locally (env: FEED_FILTER)",
+)
+@click.option(
+    "--log-level",
+    envvar="LOG_LEVEL",
+    help="Log level, 'debug' also logs received packets (env: LOG_LEVEL)",
+    type=click.Choice(["debug", "info", "warning", "error"]),
+    default="info",
+    show_default=True,
+)
+@click.option(
+    "--log-json",
+    envvar="LOG_JSON",
+    help="Log structured JSON lines instead of text (env: LOG_JSON)",
+    is_flag=True,
+)
+@click.option(
+    "--packet-log-sample",
+    envvar="PACKET_LOG_SAMPLE",
+    help="Only log one in every N packets at debug level (env: PACKET_LOG_SAMPLE)",
+    type=click.IntRange(min=1),
+    default=1,
+    show_default=True,
+)
+@click.option(
+    "--record",
+    "record_dir",
+    envvar="RECORD_DIR",
+    help="Record all raw APRS-IS lines to gzip capture files in this directory "
+    "(env: RECORD_DIR)",
+    type=click.Path(file_okay=False, writable=True, path_type=pathlib.Path),
+)
+@click.option(
+    "--record-rotate",
+    envvar="RECORD_ROTATE",
+    help="Seconds before starting a new capture file (env: RECORD_ROTATE)",
+    type=click.FloatRange(min=0, min_open=True),
+    default=3600,
+    show_default=True,
+)
+@click.option(
+    "--record-keep",
+    envvar="RECORD_KEEP",
+    help="Capture files to keep, deleting the oldest, or 0 to keep them all "
+    "(env: RECORD_KEEP)",
+    type=click.IntRange(min=0),
+    default=168,
+    show_default=True,
+)
+@click.option(
+    "--metrics-port",
+    envvar="METRICS_PORT",
+    help="Serve Prometheus metrics over HTTP on this port (env: METRICS_PORT)",
+    type=click.IntRange(min=1, max=65535),
+)
+@click.option(
+    "--trace-sample",
+    envvar="TRACE_SAMPLE",
+    help="Time the processing stages of one in every N matched packets, served at "
+    "/trace on the metrics port, 0 to disable (env: TRACE_SAMPLE)",
+    type=click.IntRange(min=0),
+    default=0,
+    show_default=True,
+)
+@click.option(
+    "--inventory-interval",
+    envvar="INVENTORY_INTERVAL",
+    help="Seconds between callsign reloads when the Icinga event stream is "
+    "unavailable (env: INVENTORY_INTERVAL)",
+    type=click.FloatRange(min=0, min_open=True),
+    default=300,
+    show_default=True,
+)
+@click.option(
+    "--inventory-debounce",
+    envvar="INVENTORY_DEBOUNCE",
+    help="Seconds without host changes before reloading callsigns "
+    "(env: INVENTORY_DEBOUNCE)",
+    type=click.FloatRange(min=0),
+    default=10,
+    show_default=True,
+)
+@click.option(
+    "--state-dir",
+    envvar="STATE_DIR",
+    help="Directory for state kept across restarts, such as check results "
+    "spooled while Icinga is unavailable (env: STATE_DIR)",
+    type=click.Path(file_okay=False, writable=True, path_type=pathlib.Path),
+)
+@click.option(
+    "--spool-size",
+    envvar="SPOOL_SIZE",
+    help="Maximum number of services to keep undelivered check results for "
+    "(env: SPOOL_SIZE)",
+    type=click.IntRange(min=1),
+    default=10_000,
+    show_default=True,
+)
+@click.option(
+    "--spool-rate",
+    envvar="SPOOL_RATE",
+    help="Check results per second to replay once Icinga is back (env: SPOOL_RATE)",
+    type=click.FloatRange(min=0, min_open=True),
+    default=20,
+    show_default=True,
+)
+@click.option(
+    "--icinga-concurrency",
+    envvar="ICINGA_CONCURRENCY",
+    help="Upper bound on the adaptive limit of concurrent Icinga API requests "
+    "(env: ICINGA_CONCURRENCY)",
+    type=click.IntRange(min=1),
+    default=16,
+    show_default=True,
+)
+@click.option(
+    "--icinga-latency-target",
+    envvar="ICINGA_LATENCY_TARGET",
+    help="Icinga API response time in seconds above which concurrency is reduced "
+    "(env: ICINGA_LATENCY_TARGET)",
+    type=click.FloatRange(min=0, min_open=True),
+    default=1,
+    show_default=True,
+)
+@click.option(
+    "--breaker-threshold",
+    envvar="BREAKER_THRESHOLD",
+    help="Consecutive Icinga API failures before requests are stopped "
+    "(env: BREAKER_THRESHOLD)",
+    type=click.IntRange(min=1),
+    default=5,
+    show_default=True,
+)
+@click.option(
+    "--breaker-reset",
+    envvar="BREAKER_RESET",
+    help="Seconds to wait before probing a failing Icinga API again "
+    "(env: BREAKER_RESET)",
+    type=click.FloatRange(min=0),
+    default=30,
+    show_default=True,
+)
+@click.option(
+    "--snapshot-interval",
+    envvar="SNAPSHOT_INTERVAL",
+    help="Seconds between snapshots of per-station state to the state directory "
+    "(env: SNAPSHOT_INTERVAL)",
+    type=click.FloatRange(min=0, min_open=True),
+    default=300,
+    show_default=True,
+)
+@click.option(
+    "--beacon-interval",
+    envvar="BEACON_INTERVAL",
+    help="Seconds expected between packets from stations without an "
+    "aprs.beacon_interval host var, until one is learned (env: BEACON_INTERVAL)",
+    type=click.FloatRange(min=0, min_open=True),
+    default=1800,
+    show_default=True,
+)
+@click.option(
+    "--stale-warning",
+    envvar="STALE_WARNING",
+    help="Beacon intervals of silence before a station goes WARNING "
+    "(env: STALE_WARNING)",
+    type=click.FloatRange(min=1),
+    default=2,
+    show_default=True,
+)
+@click.option(
+    "--stale-critical",
+    envvar="STALE_CRITICAL",
+    help="Beacon intervals of silence before a station goes CRITICAL "
+    "(env: STALE_CRITICAL)",
+    type=click.FloatRange(min=1),
+    default=4,
+    show_default=True,
+)
+@click.pass_context
 async def main(
-    icinga_host, icinga_username, icinga_password, icinga_fingerprint, aprsis_host
+    ctx,
+    icinga_host,
+    icinga_username,
+    icinga_password,
+    icinga_fingerprint,
+    aprsis_host,
+    lag_threshold,
+    redundancy,
+    dedup_ttl,
+    heartbeat_interval,
+    workers,
+    queue_size,
+    overflow,
+    coalesce_window,
+    refresh_interval,
+    shard_size,
+    full_feed,
+    feed_filter,
+    log_level,
+    log_json,
+    packet_log_sample,
+    record_dir,
+    record_rotate,
+    record_keep,
+    metrics_port,
+    trace_sample,
+    inventory_interval,
+    inventory_debounce,
+    state_dir,
+    spool_size,
+    spool_rate,
+    icinga_concurrency,
+    icinga_latency_target,
+    breaker_threshold,
+    breaker_reset,
+    snapshot_interval,
+    beacon_interval,
+    stale_warning,
+    stale_critical,
 ):
     "A passive Icinga monitoring daemon for APRS stations"
 
-    async with aiohttp.ClientSession(
-        base_url=icinga_host,
-        auth=aiohttp.BasicAuth(icinga_username, icinga_password),
-        connector=aiohttp.TCPConnector(ssl=aiohttp.Fingerprint(icinga_fingerprint)),
-        headers={"Accept": "application/json"},
-    ) as session:
-        await APRSListener(aprsis_host, session).run()
+    if full_feed:
+        if feed_filter is not None:
+            raise click.UsageError("--full-feed and --feed-filter are exclusive")
+        aprsis_port, feed_filter = 10152, ""
+    else:
+        aprsis_port = 14580
+
+    ctx.call_on_close(setup_logging(log_level, log_json, packet_log_sample).stop)
+
+    @contextlib.asynccontextmanager
+    async def connect():
+        async with aiohttp.ClientSession(
+            base_url=icinga_host,
+            auth=aiohttp.BasicAuth(icinga_username, icinga_password),
+            connector=aiohttp.TCPConnector(ssl=aiohttp.Fingerprint(icinga_fingerprint)),
+            headers={"Accept": "application/json"},
+        ) as session:
+            yield APRSListener(
+                aprsis_host=aprsis_host,
+                session=session,
+                heartbeat_interval=heartbeat_interval,
+                workers=workers,
+                queue_size=queue_size,
+                overflow=overflow,
+                coalesce_window=coalesce_window,
+                refresh_interval=refresh_interval,
+                shard_size=shard_size,
+                aprsis_port=aprsis_port,
+                feed_filter=feed_filter,
+                lag_threshold=lag_threshold,
+                redundancy=redundancy,
+                dedup_ttl=dedup_ttl,
+                record_dir=record_dir,
+                record_rotate=record_rotate,
+                record_keep=record_keep,
+                metrics_port=metrics_port,
+                trace_sample=trace_sample,
+                inventory_interval=inventory_interval,
+                inventory_debounce=inventory_debounce,
+                state_dir=state_dir,
+                spool_size=spool_size,
+                spool_rate=spool_rate,
+                icinga_concurrency=icinga_concurrency,
+                icinga_latency_target=icinga_latency_target,
+                breaker_threshold=breaker_threshold,
+                breaker_reset=breaker_reset,
+                snapshot_interval=snapshot_interval,
+                beacon_interval=beacon_interval,
+                stale_warning=stale_warning,
+                stale_critical=stale_critical,
+            )
+
+    ctx.obj = connect
+    if ctx.invoked_subcommand is None:
+        async with connect() as listener:
+            # stop cleanly on SIGTERM (e.g. docker stop), so state is
+            # snapshotted and files are closed
+            run = asyncio.ensure_future(listener.run())
+            asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, run.cancel)
+            with contextlib.suppress(asyncio.CancelledError):
+                await run
+
+
+@main.command()
+@click.option(
+    "--speed",
+    help="Replay speed as a multiple of real time, 0 for as fast as possible",
+    type=click.FloatRange(min=0),
+    default=1,
+    show_default=True,
+)
+@click.argument(
+    "captures",
+    nargs=-1,
+    required=True,
+    type=click.Path(exists=True, dir_okay=False, path_type=pathlib.Path),
+)
+@click.pass_obj
+async def replay(connect, speed, captures):
+    "Feed recorded APRS-IS capture files through the packet handler"
+    async with connect() as listener:
+        await listener.replay(captures, speed)
+        if listener.tracer.sample:
+            click.echo(json.dumps(listener.tracer.summary(), indent=2))
 
 
 if __name__ == "__main__":
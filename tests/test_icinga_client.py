@@ -0,0 +1,149 @@
+"""IcingaClient circuit breaker transitions and adaptive concurrency"""
+
+import asyncio
+import contextlib
+
+import aiohttp
+import pytest
+
+from check_aprs import BreakerState, CircuitOpen, IcingaClient, Metrics
+
+
+class Response:
+    def __init__(self, status: int):
+        self.status = status
+
+
+class FakeSession:
+    "Answers every request with `status`, or raises `error`"
+
+    def __init__(self, status: int = 200):
+        self.status = status
+        self.error: Exception | None = None
+        self.requests = 0
+
+    @contextlib.asynccontextmanager
+    async def post(self, _path, **_kwargs):
+        self.requests += 1
+        await asyncio.sleep(0)
+        if self.error is not None:
+            raise self.error
+        yield Response(self.status)
+
+
+async def request(client: IcingaClient) -> int | None:
+    "The response status, or None if the request failed or wasn't attempted"
+    try:
+        async with client.post("/v1/actions/process-check-result") as r:
+            return r.status
+    except (CircuitOpen, aiohttp.ClientError):
+        return None
+
+
+@pytest.fixture
+def session():
+    return FakeSession()
+
+
+@pytest.fixture
+def client(session):
+    return IcingaClient(session, Metrics(), failure_threshold=3, reset_timeout=30)
+
+
+def test_opens_after_consecutive_failures(session, client):
+    async def main():
+        session.status = 503
+        for _ in range(2):
+            assert await request(client) == 503
+        # a success resets the count
+        session.status = 200
+        await request(client)
+        session.status = 503
+        for _ in range(2):
+            await request(client)
+        assert client.state is BreakerState.CLOSED
+
+        await request(client)
+        assert client.state is BreakerState.OPEN
+        requests = session.requests
+        assert await request(client) is None
+        assert session.requests == requests
+
+    asyncio.run(main())
+
+
+def test_connection_errors_count_as_failures(session, client):
+    async def main():
+        session.error = aiohttp.ClientConnectionError()
+        for _ in range(3):
+            assert await request(client) is None
+        assert client.state is BreakerState.OPEN
+
+    asyncio.run(main())
+
+
+def test_client_errors_do_not_open(session, client):
+    async def main():
+        session.status = 404
+        for _ in range(10):
+            await request(client)
+        assert client.state is BreakerState.CLOSED
+
+    asyncio.run(main())
+
+
+@pytest.mark.parametrize("probe, state", [(200, "closed"), (503, "open")])
+def test_probe_after_reset_timeout(session, client, probe, state):
+    async def main():
+        session.status = 503
+        for _ in range(3):
+            await request(client)
+        client.opened -= 31
+
+        session.status = probe
+        probing = asyncio.create_task(request(client))
+        await asyncio.sleep(0)
+        assert client.state is BreakerState.HALF_OPEN
+        # only the probe is let through
+        assert await request(client) is None
+        assert await probing == probe
+        assert str(client.state) == state
+
+    asyncio.run(main())
+
+
+def test_concurrency_limit_halves_on_failure_and_recovers(session, client):
+    async def main():
+        assert client.limit == 16
+        session.status = 503
+        await request(client)
+        assert client.limit == 8
+        # failures of requests in flight together only halve once
+        await request(client)
+        assert client.limit == 8
+
+        session.status = 200
+        for _ in range(100):
+            await request(client)
+        assert client.limit == 16
+
+    asyncio.run(main())
+
+
+def test_in_flight_requests_are_capped(session):
+    async def main():
+        client = IcingaClient(session, Metrics(), max_concurrency=2)
+        peak = 0
+
+        @contextlib.asynccontextmanager
+        async def post(_path, **_kwargs):
+            nonlocal peak
+            peak = max(peak, client.in_flight)
+            await asyncio.sleep(0.01)
+            yield Response(200)
+
+        session.post = post
+        await asyncio.gather(*(request(client) for _ in range(10)))
+        assert peak == 2
+
+    asyncio.run(main())
@@ -0,0 +1,41 @@
+"""Logging through the queue, in plain and JSON formats"""
+
+import json
+
+import pytest
+
+from check_aprs import log, setup_logging
+
+
+@pytest.fixture
+def logged(capsys):
+    "Returns a function that logs an exception and returns the output"
+
+    def logged(json_format: bool) -> str:
+        handlers = list(log.handlers)
+        listener = setup_logging("info", json_format, 1)
+        try:
+            try:
+                raise ValueError("bad")
+            except ValueError:
+                log.exception("failed %s", "here", extra={"fields": {"id": 1}})
+        finally:
+            listener.stop()
+            log.handlers = handlers
+        return capsys.readouterr().err
+
+    return logged
+
+
+def test_json_keeps_the_exception_apart(logged):
+    entry = json.loads(logged(True))
+    assert entry["message"] == "failed here"
+    assert entry["id"] == 1
+    assert entry["exception"].startswith("Traceback")
+    assert entry["exception"].endswith("ValueError: bad")
+
+
+def test_plain_text_includes_the_traceback(logged):
+    output = logged(False)
+    assert output.startswith("ERROR check_aprs: failed here\nTraceback")
+    assert output.endswith("ValueError: bad\n")
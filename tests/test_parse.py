@@ -0,0 +1,51 @@
+"""The fast TNC2 parser, checked against aprs3 on tests/data/packets.txt"""
+
+import pathlib
+
+import pytest
+
+from benchmarks.bench_parse import decode, differences, read_corpus
+from check_aprs import normalize_source, parse_packet
+
+CORPUS = read_corpus([pathlib.Path(__file__).parent / "data" / "packets.txt"])
+
+
+@pytest.mark.parametrize("line", CORPUS, ids=lambda line: line.decode("latin-1"))
+def test_fast_path_agrees_with_aprs3(line):
+    fast = parse_packet(line)
+    slow = decode(line)
+    if fast is not None and slow is not None:
+        assert differences(fast, slow) == []
+
+
+def test_corpus_exercises_fast_path():
+    parsed = [line for line in CORPUS if parse_packet(line) is not None]
+    assert len(parsed) > len(CORPUS) / 2
+
+
+@pytest.mark.parametrize(
+    "source, normalized",
+    [
+        (b"N0CALL", b"N0CALL"),
+        (b"N0CALL-0", b"N0CALL"),
+        (b"N0CALL-01", b"N0CALL-1"),
+        (b"n0call-15", b"N0CALL-15"),
+        (b"N0CALL-1*", b"N0CALL-1*"),
+    ],
+)
+def test_normalize_source(source, normalized):
+    assert normalize_source(source) == normalized
+
+
+@pytest.mark.parametrize(
+    "position",
+    [
+        b"9903.50N/07201.75W",
+        b"9000.00N/07201.75W",
+        b"4960.00N/07201.75W",
+        b"4903.50N/07260.00W",
+        b"4903.50N/18101.75W",
+    ],
+)
+def test_invalid_positions_fall_back(position):
+    assert parse_packet(b"N0CALL>APRS:!" + position + b"-x") is None
@@ -0,0 +1,69 @@
+"""Capture recording, retention and reading back"""
+
+import gzip
+import threading
+
+import check_aprs
+from check_aprs import Metrics, Recorder, read_captures
+
+
+class Clock:
+    def __init__(self, now: float):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_records_and_reads_back(tmp_path):
+    recorder = Recorder(tmp_path, Metrics())
+    recorder.record(b"N0CALL>APRS:>one")
+    recorder.record(b"# keepalive")
+    recorder.close()
+    lines = [line for _, line in read_captures(sorted(tmp_path.glob("*.gz")))]
+    assert lines == [b"N0CALL>APRS:>one", b"# keepalive"]
+
+
+def test_keeps_only_the_newest_files(tmp_path, monkeypatch):
+    clock = Clock(1_800_000_000)
+    monkeypatch.setattr(check_aprs.time, "time", clock)
+    recorder = Recorder(tmp_path, Metrics(), rotate_interval=3600, keep=3)
+    for hour in range(6):
+        clock.now += 3600
+        recorder.record(b"N0CALL>APRS:>%d" % hour)
+    recorder.close()
+
+    captures = sorted(tmp_path.glob("*.gz"))
+    assert len(captures) == 3
+    lines = [line for _, line in read_captures(captures)]
+    assert lines == [b"N0CALL>APRS:>3", b"N0CALL>APRS:>4", b"N0CALL>APRS:>5"]
+
+
+def test_drops_lines_when_the_queue_is_full(tmp_path):
+    unblock = threading.Event()
+
+    class SlowRecorder(Recorder):
+        def write(self):
+            unblock.wait()
+            super().write()
+
+    metrics = Metrics()
+    recorder = SlowRecorder(tmp_path, metrics, maxsize=2)
+    for i in range(5):
+        recorder.record(b"N0CALL>APRS:>%d" % i)
+    assert metrics.counters["recorder_dropped"] == 3
+    unblock.set()
+    recorder.close()
+    assert len(list(read_captures(tmp_path.glob("*.gz")))) == 2
+
+
+def test_reads_flushed_lines_from_an_unclosed_file(tmp_path):
+    path = tmp_path / "aprsis-20261016-120000.gz"
+    with gzip.open(path, "wb") as f:
+        f.write(b"1.000000 N0CALL>APRS:>one\n")
+        f.flush()
+        # what a crash leaves behind: everything up to the last flush
+        truncated = path.read_bytes()
+    path.write_bytes(truncated)
+
+    assert list(read_captures([path])) == [(1.0, b"N0CALL>APRS:>one")]
@@ -0,0 +1,99 @@
+"""Shard connections against local fake APRS-IS servers"""
+
+import asyncio
+import contextlib
+
+from benchmarks.fake_aprsis import FakeAPRSIS
+from check_aprs import Metrics, Shard
+
+
+async def wait_for(condition, timeout: float = 5):
+    async with asyncio.timeout(timeout):
+        while not condition():
+            await asyncio.sleep(0.01)
+
+
+def test_filter_changed_during_login_is_sent():
+    async def main():
+        received = []
+        logged_in = asyncio.Event()
+        disconnected = asyncio.Event()
+
+        async def handle(reader, writer):
+            received.append(await reader.readline())
+            logged_in.set()
+            # a slow server, so the filter changes before the login is answered
+            await asyncio.sleep(0.2)
+            writer.write(b"# logresp N0CALL unverified\r\n")
+            async for line in reader:
+                received.append(line)
+            writer.close()
+            disconnected.set()
+
+        server = await asyncio.start_server(handle, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+
+        async def on_line(_line):
+            pass
+
+        shard = Shard(
+            0, 0, [("127.0.0.1", port)], "filter b/N0CALL", on_line, Metrics()
+        )
+        task = asyncio.create_task(shard.run())
+        await logged_in.wait()
+        shard.set_command("filter b/N0CALL/N1CALL")
+        await wait_for(lambda: len(received) > 1)
+        task.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await task
+        await disconnected.wait()
+        server.close()
+        await server.wait_closed()
+
+        assert received[0].endswith(b" filter b/N0CALL\r\n")
+        assert received[1:] == [b"#filter b/N0CALL/N1CALL\r\n"]
+
+    asyncio.run(main())
+
+
+def test_lagging_server_is_failed_over():
+    async def main():
+        servers = [
+            FakeAPRSIS(["N0CALL"], rate=10, keepalive_interval=0.05, name=f"FAKE{i}")
+            for i in range(2)
+        ]
+        ports = [await server.start() for server in servers]
+        # race_login tries addresses in sorted order, so the lagging server is
+        # the one the shard logs in to first
+        (_, lagging), (healthy_port, healthy) = sorted(zip(ports, servers))
+        lagging.lag = 120
+
+        received = []
+
+        async def on_line(line):
+            received.append(line)
+
+        metrics = Metrics()
+        shard = Shard(
+            0,
+            0,
+            [("127.0.0.1", port) for port in ports],
+            "filter b/N0CALL",
+            on_line,
+            metrics,
+            lag_threshold=30,
+        )
+        task = asyncio.create_task(shard.run())
+        await wait_for(lambda: lagging.clients)
+        await wait_for(lambda: shard.server == ("127.0.0.1", healthy_port))
+        await wait_for(lambda: f",{healthy.name}:".encode() in received[-1])
+        assert not lagging.clients
+        assert metrics.counters['shard_failovers{shard="0",feed="0"}'] == 1
+
+        task.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await task
+        for server in servers:
+            await server.stop()
+
+    asyncio.run(main())
@@ -0,0 +1,106 @@
+"""Spool ordering, bounds, and write-ahead log replay and compaction"""
+
+import asyncio
+
+from check_aprs import APRSListener, CheckResult, Metrics, Spool, Status
+
+
+def result(host: str, output: str = "OK: test") -> CheckResult:
+    return CheckResult("N0CALL", host, "aprsis", Status.OK, output, ["x=1"])
+
+
+def hosts(spool: Spool) -> list[str]:
+    return [host for host, _service in spool.entries]
+
+
+def test_keeps_latest_per_key_in_first_failed_order():
+    metrics = Metrics()
+    spool = Spool(metrics)
+    spool.put(result("a", "first"))
+    spool.put(result("b"))
+    spool.put(result("a", "second"))
+    assert hosts(spool) == ["a", "b"]
+    assert spool.first().plugin_output == "second"
+    assert result("a") in spool
+    assert metrics.counters["spool_superseded"] == 1
+
+
+def test_drops_oldest_beyond_maxsize():
+    metrics = Metrics()
+    spool = Spool(metrics, maxsize=2)
+    for host in "abc":
+        spool.put(result(host))
+    assert hosts(spool) == ["b", "c"]
+    assert metrics.counters["spool_dropped"] == 1
+
+
+def test_remove_keeps_a_newer_result():
+    spool = Spool(Metrics())
+    spool.put(result("a", "old"))
+    taken = spool.first()
+    spool.put(result("a", "new"))
+    spool.remove(taken)
+    assert spool.first().plugin_output == "new"
+    spool.remove(spool.first())
+    assert len(spool) == 0
+    assert not spool.nonempty.is_set()
+
+
+def test_replays_log_after_restart(tmp_path):
+    path = tmp_path / "spool.jsonl"
+    spool = Spool(Metrics(), path)
+    spool.put(result("a"))
+    spool.put(result("b", "WARNING: b"))
+    spool.put(result("c"))
+    spool.remove(spool.first())
+    spool.close()
+
+    restored = Spool(Metrics(), path)
+    assert hosts(restored) == ["b", "c"]
+    assert restored.first() == result("b", "WARNING: b")
+    assert restored.nonempty.is_set()
+
+
+def test_ignores_a_torn_final_record(tmp_path):
+    path = tmp_path / "spool.jsonl"
+    spool = Spool(Metrics(), path)
+    spool.put(result("a"))
+    spool.close()
+    with path.open("a") as f:
+        f.write('{"key": ["b", "aprs')
+
+    assert hosts(Spool(Metrics(), path)) == ["a"]
+
+
+def test_compacts_log_to_live_entries(tmp_path):
+    path = tmp_path / "spool.jsonl"
+    spool = Spool(Metrics(), path)
+    for i in range(5000):
+        spool.put(result(f"host{i % 10}", f"OK: {i}"))
+    spool.close()
+    # compacted whenever the log grows well past the live entries
+    assert len(path.read_text().splitlines()) < 1100
+
+    restored = Spool(Metrics(), path)
+    assert len(restored) == 10
+    assert restored.entries["host3", "aprsis"].plugin_output == "OK: 4993"
+    restored.close()
+    # and on startup
+    assert len(path.read_text().splitlines()) == 10
+
+
+def test_only_results_for_a_spooled_key_wait_behind_it():
+    listener = APRSListener("localhost", session=None)
+    listener.spool.put(result("a", "old"))
+    delivered = []
+
+    async def deliver(result):
+        delivered.append(result.host)
+        return True
+
+    listener.deliver = deliver
+    asyncio.run(listener.send_check(result("b")))
+    asyncio.run(listener.send_check(result("a", "new")))
+    assert delivered == ["b"]
+    assert hosts(listener.spool) == ["a"]
+    assert listener.spool.first().plugin_output == "new"
@@ -0,0 +1,95 @@
+"""WARNING and CRITICAL results for hosts that have gone silent"""
+
+import asyncio
+import json
+
+import pytest
+
+import check_aprs
+from check_aprs import APRSListener, CallsignIndex, Packet, Station, Status
+
+
+class Clock:
+    def __init__(self, now: float):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock(1_800_000_000)
+    monkeypatch.setattr(check_aprs.time, "time", clock)
+    return clock
+
+
+def make_listener(callsigns: dict[str, str], **kwargs) -> APRSListener:
+    listener = APRSListener("localhost", session=None, **kwargs)
+    listener.callsigns = CallsignIndex(callsigns)
+    listener.submitted = []
+
+    async def submit(result):
+        listener.submitted.append((result.callsign, result.exit_status))
+
+    listener.coalescer.submit = submit
+    return listener
+
+
+async def advance(listener: APRSListener, clock: Clock, seconds: float, step=60):
+    end = clock.now + seconds
+    while clock.now < end:
+        clock.now = min(clock.now + step, end)
+        for host, status in listener.staleness.advance(clock.now):
+            await listener.submit_stale(host, status)
+
+
+def test_warning_then_critical(clock):
+    async def main():
+        listener = make_listener({"N0CALL": "host"}, beacon_interval=600)
+        await listener.match_packet(Packet("N0CALL", "STATUS", b"hello"))
+        await advance(listener, clock, 1199)
+        assert listener.submitted == [("N0CALL", Status.OK)]
+        await advance(listener, clock, 2)
+        assert listener.submitted[-1] == ("N0CALL", Status.WARNING)
+        await advance(listener, clock, 1200)
+        assert listener.submitted[-1] == ("N0CALL", Status.CRITICAL)
+
+    asyncio.run(main())
+
+
+def test_any_ssid_keeps_a_wildcard_host_fresh(clock):
+    async def main():
+        listener = make_listener({"N0CALL-*": "host"}, beacon_interval=600)
+        await listener.match_packet(Packet("N0CALL-7", "STATUS", b"once"))
+        for _ in range(10):
+            await advance(listener, clock, 500)
+            await listener.match_packet(Packet("N0CALL-1", "STATUS", b"beacon"))
+        assert all(status is Status.OK for _, status in listener.submitted)
+
+        await advance(listener, clock, 3000)
+        assert listener.submitted[-2:] == [
+            ("N0CALL-1", Status.WARNING),
+            ("N0CALL-1", Status.CRITICAL),
+        ]
+
+    asyncio.run(main())
+
+
+def test_restored_stations_get_a_full_window_after_downtime(clock, tmp_path):
+    station = Station()
+    station.last_heard = clock.now - 7200
+    (tmp_path / "stations.json").write_text(json.dumps({"N0CALL": station.dump()}))
+
+    async def main():
+        listener = make_listener(
+            {"N0CALL": "host"}, beacon_interval=1800, state_dir=tmp_path
+        )
+        listener.resume_staleness()
+
+        await advance(listener, clock, 3599)
+        assert listener.submitted == []
+        await advance(listener, clock, 2)
+        assert listener.submitted == [("N0CALL", Status.WARNING)]
+
+    asyncio.run(main())
@@ -0,0 +1,84 @@
+"""Nagios range compilation and threshold evaluation of perfdata"""
+
+import pytest
+
+from check_aprs import APRSListener, Status, Thresholds, compile_range
+
+
+@pytest.mark.parametrize(
+    "spec, alerts, ok",
+    [
+        ("10", [-1, 10.5, 11], [0, 5, 10]),
+        ("10:", [9.9, -5], [10, 1e9]),
+        ("~:10", [10.1, 1e9], [-1e9, 10]),
+        ("10:20", [9, 21], [10, 15, 20]),
+        ("@10:20", [10, 15, 20], [9, 21]),
+        ("@0:0", [0], [-1, 1]),
+        (":5", [-1, 6], [0, 5]),
+        (5, [6], [5]),
+        (" 11.5: ", [11.4], [11.5]),
+    ],
+)
+def test_compile_range(spec, alerts, ok):
+    alert = compile_range(spec)
+    assert [value for value in alerts if not alert(value)] == []
+    assert [value for value in ok if alert(value)] == []
+
+
+@pytest.mark.parametrize("spec", ["20:10", "abc", "1:x"])
+def test_compile_range_rejects_invalid(spec):
+    with pytest.raises(ValueError):
+        compile_range(spec)
+
+
+def test_evaluate():
+    thresholds = Thresholds(
+        {
+            "Battery": {"warning": "11.5:", "critical": "11:"},
+            "Temp": {"critical": "~:60"},
+        }
+    )
+    status, perfdata, problems = thresholds.evaluate(
+        ["Battery=11.2V", "'Temp'=25degC", "Other=3"]
+    )
+    assert status is Status.WARNING
+    assert perfdata == ["Battery=11.2V;11.5:;11:", "'Temp'=25degC;;~:60", "Other=3"]
+    assert len(problems) == 1
+
+    status, _, problems = thresholds.evaluate(["Battery=10.5V", "Temp=70"])
+    assert status is Status.CRITICAL
+    assert len(problems) == 2
+
+    assert thresholds.evaluate(["Battery=12.6V"])[0] is Status.OK
+
+
+def test_problems_are_worded_by_range_type():
+    thresholds = Thresholds(
+        {"Battery": {"critical": "11:"}, "MSG_CNT": {"warning": "@0:0"}}
+    )
+    status, _, problems = thresholds.evaluate(["Battery=10.5V", "MSG_CNT=0"])
+    assert status is Status.CRITICAL
+    assert problems == ["Battery=10.5V outside 11:", "MSG_CNT=0 inside 0:0"]
+
+
+def test_invalid_rules_are_ignored():
+    thresholds = Thresholds({"Battery": {"warning": "12:11"}, "Temp": "60"})
+    assert thresholds.rules == {}
+    assert thresholds.evaluate(["Battery=1"])[0] is Status.OK
+
+
+def test_rules_are_only_recompiled_when_host_vars_change():
+    listener = APRSListener("localhost", session=None)
+    config = {"Battery": {"warning": "11.5:"}}
+    listener.host_vars = {"a": {"thresholds": config}, "b": {"callsign": "N0CALL"}}
+    listener.update_thresholds()
+    compiled = listener.thresholds["a"]
+    assert list(listener.thresholds) == ["a"]
+
+    listener.host_vars = {"a": {"thresholds": dict(config)}}
+    listener.update_thresholds()
+    assert listener.thresholds["a"] is compiled
+
+    listener.host_vars = {"a": {"thresholds": {"Battery": {"warning": "12:"}}}}
+    listener.update_thresholds()
+    assert listener.thresholds["a"] is not compiled
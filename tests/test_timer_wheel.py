@@ -0,0 +1,77 @@
+"""TimerWheel scheduling, cancelling and cascading between levels"""
+
+import math
+import random
+
+from check_aprs import TimerWheel
+
+
+def fire_times(wheel: TimerWheel, until: int) -> dict:
+    "Advance one tick at a time, returning the tick each key fired at"
+    fired = {}
+    for tick in range(wheel.tick + 1, until + 1):
+        for key, _payload in wheel.advance(tick * wheel.resolution):
+            assert key not in fired
+            fired[key] = tick
+    return fired
+
+
+def test_fires_at_deadline():
+    wheel = TimerWheel(0)
+    wheel.schedule("a", 5.5, "payload")
+    assert wheel.advance(5) == []
+    assert wheel.advance(6) == [("a", "payload")]
+    assert len(wheel) == 0
+    assert wheel.advance(100) == []
+
+
+def test_past_deadline_fires_on_next_tick():
+    wheel = TimerWheel(100)
+    wheel.schedule("a", 50)
+    assert wheel.advance(101) == [("a", None)]
+
+
+def test_cancel_and_reschedule():
+    wheel = TimerWheel(0)
+    wheel.schedule("a", 10)
+    wheel.schedule("b", 10)
+    wheel.cancel("a")
+    wheel.cancel("missing")
+    wheel.schedule("b", 20, "later")
+    assert len(wheel) == 1
+    assert wheel.advance(10) == []
+    assert wheel.advance(20) == [("b", "later")]
+
+
+def test_cascades_through_every_level():
+    wheel = TimerWheel(0, size=8, levels=3)
+    deadlines = {f"t{ticks}": ticks for ticks in (1, 7, 8, 9, 63, 64, 65, 200, 511)}
+    for key, ticks in deadlines.items():
+        wheel.schedule(key, ticks)
+    assert fire_times(wheel, 600) == deadlines
+
+
+def test_random_deadlines_fire_exactly_once_on_time():
+    rng = random.Random(0)
+    wheel = TimerWheel(1000, resolution=0.5, size=16, levels=3)
+    deadlines = {}
+    for key in range(2000):
+        deadline = 1000 + rng.uniform(0, 1000)
+        wheel.schedule(key, deadline)
+        deadlines[key] = math.ceil(deadline / 0.5)
+    # a few are rescheduled or cancelled along the way
+    for key in range(0, 2000, 7):
+        deadline = 1000 + rng.uniform(0, 1000)
+        wheel.schedule(key, deadline)
+        deadlines[key] = math.ceil(deadline / 0.5)
+    for key in range(3, 2000, 11):
+        wheel.cancel(key)
+        del deadlines[key]
+    assert fire_times(wheel, 4001) == deadlines
+
+
+def test_deadlines_beyond_the_top_level_are_clamped():
+    wheel = TimerWheel(0, size=4, levels=2)
+    wheel.schedule("far", 1000)
+    fired = fire_times(wheel, 1000)
+    assert fired == {"far": 15}
@@ -0,0 +1,42 @@
+"""Sampling of packet traces in dispatch_line"""
+
+import asyncio
+
+from check_aprs import APRSListener, CallsignIndex
+
+
+def make_listener(trace_sample: int) -> APRSListener:
+    listener = APRSListener("localhost", session=None, trace_sample=trace_sample)
+    listener.callsigns = CallsignIndex({"N0CALL": "host1"})
+    listener.submitted = []
+
+    async def submit(key, job, droppable=True):
+        listener.submitted.append(key)
+
+    listener.dispatcher.submit = submit
+    return listener
+
+
+def feed(listener: APRSListener, *lines: bytes):
+    async def main():
+        for line in lines:
+            await listener.dispatch_line(line)
+
+    asyncio.run(main())
+
+
+def test_unmatched_packets_are_not_sampled():
+    listener = make_listener(trace_sample=2)
+    feed(listener, *[b"N1CALL>APRS:!4903.50N/07201.75W-"] * 10)
+    assert listener.tracer.count == 0
+    assert not listener.tracer.summary()
+
+
+def test_matched_packets_are_sampled():
+    listener = make_listener(trace_sample=2)
+    lines = [b"N1CALL>APRS:!4903.50N/07201.75W-", b"N0CALL>APRS:!4903.50N/07201.75W-"]
+    feed(listener, *lines * 3)
+    assert listener.tracer.count == 3
+    assert listener.submitted == ["N0CALL"] * 3
+    (decode,) = listener.tracer.summary()["decode"].values()
+    assert decode["count"] == 1